@@ -51,7 +51,7 @@ if __name__ == '__main__':
             print(moviepath, movieid, ' exists.')
 
         with open('{0}/{1}.nfo'.format(moviepath, moviefolder), 'w') as f:
-            f.write(json.dumps(movie.result_dict))
+            f.write(json.dumps(dict(movie.result_dict)))
         print('Downloading: {} [{}/{}]'.format(movieid, cnt, length), end='\r')
         cnt += 1
 
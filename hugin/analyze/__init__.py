@@ -6,11 +6,32 @@ from yapsy.IPlugin import IPlugin
 
 class IModifier(IPlugin):
 
+    # Worker processes and movies per worker task used by
+    # :func:`hugin.analyze.session.Session.modify_all`, None means default.
+    workers = None
+    chunksize = None
+
+    # Directory for persistent plugin data like caches, the session sets it
+    # to a directory next to the database.
+    cache_path = None
+
     def modify(self, movie, **kwargs):
         pass
 
     def modify_all(self, database, **kwargs):
-        pass
+        for movie in database.values():
+            self.modify(movie, **kwargs)
+
+    def input_stamp(self, movie):
+        # inputs besides the movie attributes, e.g. file stats, a change
+        # makes :func:`hugin.analyze.session.Session.modify_all` run again
+        return None
+
+    def failed(self, movie):
+        # True if the last run failed for movie, failed movies are not
+        # stamped, :func:`hugin.analyze.session.Session.modify_all` retries
+        # them on the next run
+        return False
 
     def parameters(self):
         return {}
@@ -18,11 +39,32 @@ class IModifier(IPlugin):
 
 class IAnalyzer(IPlugin):
 
+    # Worker processes and movies per worker task used by
+    # :func:`hugin.analyze.session.Session.analyze_all`, None means default.
+    workers = None
+    chunksize = None
+
+    # Directory for persistent plugin data like caches, the session sets it
+    # to a directory next to the database.
+    cache_path = None
+
     def analyze(self, movie, **kwargs):
         pass
 
     def analyze_all(self, database, **kwargs):
-        pass
+        for movie in database.values():
+            self.analyze(movie, **kwargs)
+
+    def input_stamp(self, movie):
+        # inputs besides the movie attributes, e.g. file stats, a change
+        # makes :func:`hugin.analyze.session.Session.analyze_all` run again
+        return None
+
+    def failed(self, movie):
+        # True if the last run failed for movie, failed movies are not
+        # stamped, :func:`hugin.analyze.session.Session.analyze_all` retries
+        # them on the next run
+        return False
 
     def parameters(self):
         return {}
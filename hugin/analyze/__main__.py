@@ -9,11 +9,9 @@ import glob
 import xmltodict
 import json
 
-# 3rd party
-from guess_language import guess_language
-
 # hugin
 from hugin.analyze.session import Session
+from hugin.analyze.langid import identify
 
 MASK = {
     'title': 'title', 'originaltitle': 'original_title', 'year': 'year',
@@ -51,6 +49,6 @@ if __name__ == '__main__':
 
     for item in dict(s._database).values():
         if item.attributes and item.attributes.get('plot'):
-            c[guess_language(item.attributes['plot'])] += 1
+            c[identify(item.attributes['plot'])] += 1
     print(s.stats(), c)
     s.database_shutdown()
@@ -3,6 +3,7 @@
 
 # stdlib
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from functools import reduce
 import subprocess
 import os
@@ -12,38 +13,113 @@ import yaml
 
 # hugin
 import hugin.analyze as plugin
+from hugin.harvest.cache import Cache
 
 
 MOVIE_FILESIZE = (1 * 1024 ** 2)
 
+# the C loader is much faster, but only available if libyaml is installed
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
-class MovieFileAnalyze(plugin.IAnalyzer):
 
-    def analyze(self, movie):
-        movie_metadata = []
-        for moviefile in self._get_movie_files(movie.key):
-            output = subprocess.check_output(
-                ['hachoir-metadata', '--raw', moviefile]
-            )
-            normalized_metadata = self._normalize(
-                self._concat_yaml_dict(yaml.load(output))
-            )
-            movie_metadata.append((moviefile, normalized_metadata))
-        movie.analyzer_data[self.name] = movie_metadata
+class MovieFileAnalyze(plugin.IAnalyzer):
 
-    def analyze_all(self, db):
-        for movie in db.values():
-            self.process(movie)
+    # probes run on a thread pool, the probe cache is not shared between
+    # processes
+    workers = 1
+
+    def analyze(self, movie, probe_workers=4, cache_path=None):
+        self.analyze_all({movie.key: movie}, probe_workers, cache_path)
+
+    def analyze_all(self, database, probe_workers=4, cache_path=None):
+        """ Probe the movie files of all movies on a thread pool.
+
+        Probe results are cached by path, size and modification time of the
+        movie file, so only new or changed files are probed again. Failed
+        probes are not cached.
+
+        :param probe_workers: Max. number of concurrent probes.
+        :param cache_path: Path of the probe cache, defaults to the plugins
+                           cache_path, without any path nothing is cached.
+
+        """
+        cache = None
+        cache_path = cache_path or self.cache_path
+        if cache_path is not None:
+            cache = Cache()
+            cache.open(path=cache_path, cache_name='probe_cache.db')
+        try:
+            with ThreadPoolExecutor(max_workers=probe_workers) as executor:
+                probes = []
+                for movie in database.values():
+                    movie_files = self._get_movie_files(movie.key)
+                    probes.append((movie, [
+                        (moviefile, executor.submit(
+                            self._probe, cache, moviefile, size, mtime
+                        )) for moviefile, size, mtime in movie_files
+                    ]))
+                for movie, movie_probes in probes:
+                    movie.analyzer_data[self.name] = [
+                        (moviefile, future.result())
+                        for moviefile, future in movie_probes
+                    ]
+        finally:
+            if cache is not None:
+                cache.close()
+
+    def input_stamp(self, movie):
+        # new, replaced or removed movie files are probed again
+        return sorted(self._get_movie_files(movie.key))
+
+    def failed(self, movie):
+        # movies with a failed probe are probed again on the next run
+        return any(
+            metadata is None
+            for _, metadata in movie.analyzer_data.get(self.name) or ()
+        )
+
+    def parameters(self):
+        return {
+            'probe_workers': int,
+            'cache_path': str
+        }
 
 ##############################################################################
 # -------------------------- helper functions --------------------------------
 ##############################################################################
+    def _probe(self, cache, moviefile, size, mtime):
+        key = '{}:{}:{}'.format(size, mtime, moviefile)
+        metadata = None if cache is None else cache.read(key)
+        if metadata is None:
+            try:
+                output = subprocess.check_output(
+                    ['hachoir-metadata', '--raw', moviefile]
+                )
+                metadata = self._normalize(
+                    self._concat_yaml_dict(yaml.load(output, YAML_LOADER))
+                )
+            except (OSError, subprocess.CalledProcessError,
+                    yaml.YAMLError) as e:
+                print('Error while probing', moviefile, e)
+                return None
+            if cache is not None:
+                cache.write(key, metadata)
+        return metadata
+
     def _get_movie_files(self, path, threshold=MOVIE_FILESIZE):
+        """ Return (moviefile, size, mtime) of all files bigger threshold. """
         movie_files = []
-        files = [os.path.join(path, item) for item in os.listdir(path)]
-        for moviefile in files:
-            if os.path.getsize(moviefile) > threshold:
-                movie_files.append(moviefile)
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        if stat.st_size > threshold:
+                            movie_files.append(
+                                (entry.path, stat.st_size, stat.st_mtime)
+                            )
+        except FileNotFoundError:
+            pass
         return movie_files
 
     def _normalize(self, attrs):
@@ -100,3 +176,44 @@ class MovieFileAnalyze(plugin.IAnalyzer):
 
     def _concat_dicts(self, attr):
         return reduce(lambda x, y: dict(x, **y), attr)
+
+
+if __name__ == '__main__':
+    import unittest
+    import tempfile
+    import shutil
+    from unittest import mock
+    from hugin.analyze.movie import Movie
+
+    class TestMovieFileAnalyze(unittest.TestCase):
+
+        def setUp(self):
+            self._path = tempfile.mkdtemp()
+            self._movie = Movie(self._path, None, {})
+            with open(os.path.join(self._path, 'movie.mkv'), 'wb') as f:
+                f.truncate(MOVIE_FILESIZE + 1)
+            self._plugin = MovieFileAnalyze()
+            self._plugin.name = 'MovieFileAnalyze'
+            self._plugin.cache_path = os.path.join(self._path, 'cache')
+
+        def test_failed_probe(self):
+            error = subprocess.CalledProcessError(1, 'hachoir-metadata')
+            with mock.patch('subprocess.check_output', side_effect=error):
+                self._plugin.analyze(self._movie)
+            self.assertTrue(self._plugin.failed(self._movie))
+
+            # failed probes are not cached, the next run probes again
+            output = b'video[1]:\n- width: 1920\n- height: 800\n'
+            with mock.patch('subprocess.check_output', return_value=output):
+                self._plugin.analyze(self._movie)
+            self.assertFalse(self._plugin.failed(self._movie))
+            (moviefile, metadata), = self._movie.analyzer_data[
+                'MovieFileAnalyze'
+            ]
+            self.assertEqual(metadata['video_0']['aspect'], 2.4)
+            self.assertTrue(os.path.isdir(self._plugin.cache_path))
+
+        def tearDown(self):
+            shutil.rmtree(self._path)
+
+    unittest.main()
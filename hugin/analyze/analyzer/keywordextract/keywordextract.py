@@ -3,28 +3,78 @@
 
 # hugin
 import hugin.analyze as plugin
-from hugin.analyze.rake import extract_keywords
+from hugin.analyze.rake import extract_keywords_batch
 
 
 class KeywordExtract(plugin.IAnalyzer):
 
-    def analyze(self, movie, score_threshold=1.0, attr_name='plot'):
-        if movie.attributes.get(attr_name):
-            lang, keywords = extract_keywords(
-                movie.attributes.get(attr_name), use_stemmer=False
-            )
+    def analyze(
+            self, movie, score_threshold=1.0, attr_name='plot',
+            language=None):
+        self.analyze_all(
+            {movie.key: movie}, score_threshold, attr_name, language
+        )
+
+    def analyze_all(
+            self, database, score_threshold=1.0, attr_name='plot',
+            language=None):
+        """ Extract the keywords of all movies with one batch.
+
+        :param language: Language of all texts, skips language guessing.
+
+        """
+        movies = [
+            movie for movie in database.values()
+            if movie.attributes.get(attr_name)
+        ]
+        results = extract_keywords_batch(
+            [movie.attributes.get(attr_name) for movie in movies],
+            use_stemmer=False,
+            languages=[language] * len(movies)
+        )
+        for movie, (lang, keywords) in zip(movies, results):
             keywordlist = []
             for keyword, score in keywords.items():
                 if score > score_threshold:
                     keywordlist.append(list(keyword))
             movie.analyzer_data[self.name] = keywordlist
 
-    def analyze_all(self, database):
-        for movie in database.values():
-            self.process_movie(movie)
-
     def parameters(self):
         return {
             'score_threshold': float,
-            'attr_name': str
+            'attr_name': str,
+            'language': str
         }
+
+
+if __name__ == '__main__':
+    import unittest
+    from hugin.analyze.movie import Movie
+    from hugin.analyze.rake import extract_keywords
+
+    class TestKeywordExtract(unittest.TestCase):
+
+        def setUp(self):
+            self._analyzer = KeywordExtract()
+            self._analyzer.name = 'KeywordExtract'
+
+        def test_unidentified_language(self):
+            self.assertEqual(extract_keywords('Katzenbaum'), (None, {}))
+            self.assertEqual(extract_keywords(''), (None, {}))
+
+        def test_analyze_all(self):
+            database = {
+                'a': Movie('a', None, {'plot': 'Katzenbaum'}),
+                'b': Movie('b', None, {
+                    'plot': 'An evil wizard forges a magic ring. A young '
+                            'hobbit has to destroy the magic ring.'
+                })
+            }
+            self._analyzer.analyze_all(database)
+            self.assertEqual(database['a'].analyzer_data['KeywordExtract'], [])
+            self.assertTrue(
+                ['magic', 'ring'] in
+                database['b'].analyzer_data['KeywordExtract']
+            )
+
+    unittest.main()
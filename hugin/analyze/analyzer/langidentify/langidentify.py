@@ -1,21 +1,23 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-from guess_language import guess_language
-
 # hugin
 import hugin.analyze as plugin
+from hugin.analyze.langid import identify_batch
 
 
 class LangIdentify(plugin.IAnalyzer):
 
     def analyze(self, movie, attr_name='plot'):
-        lang = str(guess_language(movie.attributes.get(attr_name) or ''))
-        movie.analyzer_data[self.name] = lang
+        self.analyze_all({movie.key: movie}, attr_name)
 
-    def analyze_all(self, database):
-        for movie in database.values():
-            self.process_movie(movie)
+    def analyze_all(self, database, attr_name='plot'):
+        movies = list(database.values())
+        languages = identify_batch(
+            movie.attributes.get(attr_name) for movie in movies
+        )
+        for movie, lang in zip(movies, languages):
+            movie.analyzer_data[self.name] = lang or 'UNKNOWN'
 
     def parameters(self):
         return {
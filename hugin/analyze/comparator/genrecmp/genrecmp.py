@@ -2,7 +2,8 @@
 # encoding: utf-8
 
 # stdlib
-from itertools import combinations
+from collections import defaultdict, OrderedDict
+from itertools import combinations, islice
 
 # hugin
 import hugin.analyze as plugin
@@ -13,11 +14,109 @@ class GenreCmp(plugin.IComparator):
     def compare(self, movie_a, movie_b):
         pass
 
-    def compare_all(self, database, threshold=0.51, attr_name='genre'):
-        for a, b in combinations(database.values(), 2):
-            if a.attributes.get(attr_name) and b.attributes.get(attr_name):
-                distance = self._genre_distance(a, b, attr_name)
-                if distance > threshold:
+    def compare_all(
+        self, database, threshold=0.51, attr_name='genre', top_k=None
+    ):
+        """ Compare the genres of all movies in database.
+
+        Movies with the same genre set are grouped first, every group gets a
+        genre bitset. Only groups sharing at least one genre are compared, so
+        the number of comparisons depends on the number of distinct genre
+        combinations, not on the number of movies.
+
+        :param threshold: Min. distance for movies to be considered similar.
+        :param attr_name: Attribute containing the genre list.
+        :param top_k: Only keep the top_k most similar movies per movie.
+
+        """
+        groups = self._group_by_genre(database, attr_name)
+        bitsets, sizes = self._genre_bitsets(groups.keys())
+
+        # distance of similar group pairs, a group is similar to itself
+        group_distances = defaultdict(list)
+        for group in range(len(bitsets)):
+            if threshold < 1.0:
+                group_distances[group].append((1.0, group))
+
+        for group_a, group_b in self._candidate_pairs(bitsets):
+            distance = self._bitset_distance(
+                bitsets[group_a], bitsets[group_b],
+                sizes[group_a], sizes[group_b]
+            )
+            if distance > threshold:
+                group_distances[group_a].append((distance, group_b))
+                group_distances[group_b].append((distance, group_a))
+
+        group_movies = list(groups.values())
+        if top_k is None:
+            self._add_all_pairs(group_movies, group_distances)
+        else:
+            self._add_top_k(group_movies, group_distances, top_k)
+
+##############################################################################
+# -------------------------- helper functions --------------------------------
+##############################################################################
+
+    def _group_by_genre(self, database, attr):
+        """ Return a genre set -> movie list mapping. """
+        groups = OrderedDict()
+        for movie in database.values():
+            genres = movie.attributes.get(attr)
+            if genres:
+                groups.setdefault(frozenset(genres), []).append(movie)
+        return groups
+
+    def _genre_bitsets(self, genre_sets):
+        """ Return bitset representation and size of every genre set. """
+        genre_bits, bitsets, sizes = {}, [], []
+        for genre_set in genre_sets:
+            bitset = 0
+            for genre in genre_set:
+                bitset |= 1 << genre_bits.setdefault(genre, len(genre_bits))
+            bitsets.append(bitset)
+            sizes.append(len(genre_set))
+        return bitsets, sizes
+
+    def _candidate_pairs(self, bitsets):
+        """ Yield all pairs of bitset indexes sharing at least one genre. """
+        postings = defaultdict(list)
+        for group, bitset in enumerate(bitsets):
+            bit = 0
+            while bitset >> bit:
+                if (bitset >> bit) & 1:
+                    postings[bit].append(group)
+                bit += 1
+
+        for group, bitset in enumerate(bitsets):
+            candidates = set()
+            bit = 0
+            while bitset >> bit:
+                if (bitset >> bit) & 1:
+                    candidates.update(postings[bit])
+                bit += 1
+            for candidate in sorted(candidates):
+                if candidate > group:
+                    yield group, candidate
+
+    def _bitset_distance(self, bitset_a, bitset_b, size_a, size_b):
+        """ Bitset variant of :func:`_genre_distance`. """
+        shared = bin(bitset_a & bitset_b).count('1')
+        return shared / max(size_a, size_b)
+
+    def _add_all_pairs(self, group_movies, group_distances):
+        """ Add every movie pair of the similar groups to comparator_data. """
+        for group_a, similar_groups in group_distances.items():
+            for distance, group_b in similar_groups:
+                if group_a > group_b:
+                    continue
+                if group_a == group_b:
+                    pairs = combinations(group_movies[group_a], 2)
+                else:
+                    pairs = (
+                        (a, b) for a in group_movies[group_a]
+                        for b in group_movies[group_b]
+                    )
+                for a, b in pairs:
                     a.comparator_data.setdefault(self.name, set()).add(
                         (b, distance)
                     )
@@ -25,9 +124,20 @@ class GenreCmp(plugin.IComparator):
                         (a, distance)
                     )
 
-##############################################################################
-# -------------------------- helper functions --------------------------------
-##############################################################################
+    def _add_top_k(self, group_movies, group_distances, top_k):
+        """ Add only the top_k most similar movies of every movie. """
+        for group, similar_groups in group_distances.items():
+            ranked = sorted(
+                similar_groups, key=lambda item: item[0], reverse=True
+            )
+            for movie in group_movies[group]:
+                similar = movie.comparator_data.setdefault(self.name, set())
+                candidates = (
+                    (other, distance) for distance, similar_group in ranked
+                    for other in group_movies[similar_group]
+                    if other is not movie
+                )
+                similar.update(islice(candidates, top_k))
 
     def _genre_distance(self, a, b, attr):
         """ Calculate the 'distance' between two genres
@@ -35,3 +145,97 @@ class GenreCmp(plugin.IComparator):
         """
         a, b = set(a.attributes.get(attr)), set(b.attributes.get(attr))
         return len(a & b) / max(len(a), len(b))
+
+
+if __name__ == '__main__':
+    import unittest
+    import random
+    import timeit
+    import sys
+    from hugin.analyze.movie import Movie
+
+    GENRES = [
+        'Drama', 'Action', 'Komödie', 'Thriller', 'Horror', 'Krimi',
+        'Abenteuer', 'Fantasy', 'Animation', 'Western', 'Krieg',
+        'Science Fiction', 'Dokumentarfilm', 'Musik', 'Familienfilm'
+    ]
+
+    def create_database(size, seed=42):
+        random.seed(seed)
+        database = OrderedDict()
+        for num in range(size):
+            genres = random.sample(GENRES, random.randint(0, 4))
+            movie = Movie('/movies/{}'.format(num), None, {'genre': genres})
+            database[movie.key] = movie
+        return database
+
+    def reference_compare_all(cmp, database, threshold, attr_name='genre'):
+        """ The former pairwise implementation, used as reference. """
+        for a, b in combinations(database.values(), 2):
+            if a.attributes.get(attr_name) and b.attributes.get(attr_name):
+                distance = cmp._genre_distance(a, b, attr_name)
+                if distance > threshold:
+                    a.comparator_data.setdefault(cmp.name, set()).add(
+                        (b, distance)
+                    )
+                    b.comparator_data.setdefault(cmp.name, set()).add(
+                        (a, distance)
+                    )
+
+    def comparator_data(database):
+        return {
+            movie.key: {
+                (other.key, distance) for other, distance in
+                movie.comparator_data.get('GenreCmp', ())
+            } for movie in database.values()
+        }
+
+    class TestGenreCmp(unittest.TestCase):
+
+        def setUp(self):
+            self._cmp = GenreCmp()
+            self._cmp.name = 'GenreCmp'
+
+        def test_same_result(self):
+            for threshold in [0.0, 0.3, 0.51, 0.9, 1.0]:
+                expected, database = create_database(300), create_database(300)
+                reference_compare_all(self._cmp, expected, threshold)
+                self._cmp.compare_all(database, threshold)
+                self.assertEqual(
+                    comparator_data(expected), comparator_data(database)
+                )
+
+        def test_top_k(self):
+            full, database = create_database(300), create_database(300)
+            self._cmp.compare_all(full)
+            self._cmp.compare_all(database, top_k=5)
+            full_data = comparator_data(full)
+            for key, similar in comparator_data(database).items():
+                self.assertTrue(len(similar) <= 5)
+                self.assertTrue(similar <= full_data[key])
+                if similar:
+                    best = max(distance for _, distance in full_data[key])
+                    self.assertEqual(
+                        max(distance for _, distance in similar), best
+                    )
+
+    if '--bench' in sys.argv:
+        cmp = GenreCmp()
+        cmp.name = 'GenreCmp'
+        for size in [500, 1000, 2000]:
+            database = create_database(size)
+            reference = timeit.timeit(
+                lambda: reference_compare_all(cmp, database, 0.51), number=1
+            )
+            database = create_database(size)
+            blocked = timeit.timeit(
+                lambda: cmp.compare_all(database, 0.51), number=1
+            )
+            database = create_database(size)
+            top_k = timeit.timeit(
+                lambda: cmp.compare_all(database, 0.51, top_k=10), number=1
+            )
+            print('{:>6} movies: pairwise {:.3f}s, blocked {:.3f}s, '
+                  'top 10 {:.3f}s'.format(size, reference, blocked, top_k))
+    else:
+        unittest.main()
@@ -3,7 +3,7 @@
 
 # stdlib
 from itertools import combinations
-from collections import Counter
+from collections import Counter, defaultdict
 
 # hugin
 import hugin.analyze as plugin
@@ -14,42 +14,116 @@ class KeywordCmp(plugin.IComparator):
     def compare(self, movie_a, movie_b):
         pass
 
-    def compare_all(self, database, attr_name='KeywordExtractor'):
-        for a, b in combinations(database.values(), 2):
-            keywords_a = a.comparator_data.get(attr_name)
-            keywords_b = b.comparator_data.get(attr_name)
-            if keywords_a and keywords_b:
-                rating = self._compare_keywords(keywords_a, keywords_b)
-                rating = sum(rating.values()) / len(rating)
-                a.comparator_data.setdefault(self.name, set()).add(
-                    (b, rating)
-                )
-                b.comparator_data.setdefault(self.name, set()).add(
-                    (a, rating)
-                )
+    def compare_all(self, database, attr_name='KeywordExtract'):
+        """ Compare the extracted keywords of all movies in database.
+
+        Keywords are grouped by length once per movie. An inverted index maps
+        every keyword to the movies containing it, so only movies sharing at
+        least one keyword are compared. The shared keyword counts are the
+        sparse product of the movie/keyword matrix with its transpose.
+
+        :param attr_name: Analyzer that extracted the keywords.
+
+        """
+        movies, groups = [], []
+        for movie in database.values():
+            keywords = movie.analyzer_data.get(attr_name)
+            if keywords:
+                movies.append(movie)
+                groups.append(self._group_by_length(keywords))
+
+        for (a, b), shared in self._shared_keywords(groups).items():
+            rating = self._rating(groups[a], groups[b], shared)
+            movies[a].comparator_data.setdefault(self.name, set()).add(
+                (movies[b], rating)
+            )
+            movies[b].comparator_data.setdefault(self.name, set()).add(
+                (movies[a], rating)
+            )
 
 ##############################################################################
 # -------------------------- helper functions --------------------------------
 ##############################################################################
 
-    def _compare_keywords(self, keywords_a, keywords_b):
-        result = {}
-        grouped_a = self._group_by_length(keywords_a)
-        grouped_b = self._group_by_length(keywords_b)
-        for cnt_a, group_a in grouped_a.items():
-            result[cnt_a] = 0
-            for cnt_b, group_b in grouped_b.items():
-                if cnt_a == cnt_b:
-                    rating = self._compare(group_a, group_b, cnt_a)
-                    result[cnt_a] += rating / min(len(group_a), len(group_b))
+    def _shared_keywords(self, groups):
+        """ Count shared keywords per length for all candidate movie pairs.
+
+        :param groups: A list with grouped keywords per movie.
+        :returns: A (movie_a, movie_b) -> Counter(length: shared) mapping.
+
+        """
+        postings = defaultdict(list)
+        for movie, grouped in enumerate(groups):
+            for length, keywords in grouped.items():
+                for keyword in keywords:
+                    postings[keyword].append(movie)
+
+        shared = defaultdict(Counter)
+        for keyword, movies in postings.items():
+            for pair in combinations(movies, 2):
+                shared[pair][len(keyword)] += 1
+        return shared
+
+    def _rating(self, grouped_a, grouped_b, shared):
+        """ Rate two movies by their shared keywords.
+
+        For every keyword length both movies have in common, the number of
+        shared keywords is divided by the size of the smaller group. The
+        rating is the average over all keyword lengths of both movies.
 
-        return result
+        """
+        rating = 0.0
+        for length, count in shared.items():
+            group_size = min(len(grouped_a[length]), len(grouped_b[length]))
+            rating += count / group_size
+        return rating / len(grouped_a.keys() | grouped_b.keys())
 
     def _group_by_length(self, keywords):
-        cnt = Counter()
+        """ Return a keyword length -> set of keywords mapping.
+
+        Keywords are word sets, so different word orders are considered equal.
+
+        """
+        grouped = defaultdict(set)
         for keyword in keywords:
-            cnt.setdefault(len(keyword), []).append(keyword)
-        return cnt
+            keyword = frozenset(keyword)
+            grouped[len(keyword)].add(keyword)
+        return grouped
+
+
+if __name__ == '__main__':
+    import unittest
+    from hugin.analyze.movie import Movie
+
+    class TestKeywordCmp(unittest.TestCase):
+
+        def setUp(self):
+            self._cmp = KeywordCmp()
+            self._cmp.name = 'KeywordCmp'
+            keywords = {
+                'a': [['evil', 'wizard'], ['ring'], ['hobbit']],
+                'b': [['wizard', 'evil'], ['ring'], ['dragon']],
+                'c': [['space', 'ship'], ['alien']],
+                'd': []
+            }
+            self._database = {}
+            for key, movie_keywords in keywords.items():
+                movie = Movie(key, None, {})
+                movie.analyzer_data['KeywordExtract'] = movie_keywords
+                self._database[key] = movie
+
+        def similar(self, key):
+            return {
+                (movie.key, rating) for movie, rating in
+                self._database[key].comparator_data.get('KeywordCmp', ())
+            }
+
+        def test_compare_all(self):
+            self._cmp.compare_all(self._database)
+            # two lengths: 1/1 shared two word keywords, 1/2 shared one word
+            self.assertEqual(self.similar('a'), {('b', 0.75)})
+            self.assertEqual(self.similar('b'), {('a', 0.75)})
+            self.assertEqual(self.similar('c'), set())
+            self.assertEqual(self.similar('d'), set())
 
-    def _compare(self, a, b, cnt):
-        return len(frozenset(tuple(a[0])) & frozenset(tuple(b[0]))) / cnt
+    unittest.main()
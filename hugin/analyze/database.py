@@ -0,0 +1,401 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Overview
+~~~~~~~~
+
+SQLite backed movie database used by :class:`hugin.analyze.session.Session`.
+
+Every movie is pickled into its own row, so single movies can be read and
+written without loading the whole database. Movies are unpickled lazily on
+access and kept in a cache, modified movies are written back on
+:func:`MovieDatabase.sync`. A sync is a single transaction, a crash leaves
+the database at the state of the last sync.
+
+Movies reference other movies in their comparator data. These references
+are stored as movie keys and loaded as :class:`MovieRef` objects, which
+load the referenced movie on first attribute access.
+
+The database also keeps the scan manifest, the stamp of every metadata
+file at the last library scan, see :func:`hugin.filewalk.rescan_metadata`.
+"""
+
+# stdlib
+from collections.abc import MutableMapping
+import hashlib
+import sqlite3
+import pickle
+import io
+import os
+
+# hugin
+from hugin.analyze.movie import Movie
+
+
+SQLITE_HEADER = b'SQLite format 3\x00'
+
+
+class MovieRef:
+    """ Lazy reference to a movie stored in a :class:`MovieDatabase`. """
+
+    __slots__ = ('_database', 'key')
+
+    def __init__(self, database, key):
+        self._database = database
+        self.key = key
+
+    def __getattr__(self, name):
+        return getattr(self._database[self.key], name)
+
+    def __eq__(self, other):
+        return isinstance(other, (Movie, MovieRef)) and self.key == other.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return repr(self._database[self.key])
+
+
+class _MoviePickler(pickle.Pickler):
+    """ Pickle a movie, other movies are replaced by their key. """
+
+    def __init__(self, file, movie):
+        pickle.Pickler.__init__(self, file, pickle.HIGHEST_PROTOCOL)
+        self._movie = movie
+
+    def persistent_id(self, obj):
+        if isinstance(obj, (Movie, MovieRef)) and obj is not self._movie:
+            return obj.key
+        return None
+
+
+class _MovieUnpickler(pickle.Unpickler):
+    """ Unpickle a movie, other movies are loaded as references. """
+
+    def __init__(self, file, database):
+        pickle.Unpickler.__init__(self, file)
+        self._database = database
+
+    def persistent_load(self, key):
+        return self._database.reference(key)
+
+
+class _LegacyMovie(Movie):
+    """ Movie hashed by identity, used to unpickle old databases.
+
+    Movies of old databases reference each other in comparator data sets,
+    these sets are rebuilt before the referenced movies have a key.
+
+    """
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+    """ Unpickle a whole-file pickled database with :class:`_LegacyMovie`. """
+
+    def find_class(self, module, name):
+        if (module, name) == ('hugin.analyze.movie', 'Movie'):
+            return _LegacyMovie
+        return pickle.Unpickler.find_class(self, module, name)
+
+
+class MovieDatabase(MutableMapping):
+    """
+    A movie key -> :class:`hugin.analyze.movie.Movie` mapping on disk.
+
+    Iteration yields the keys in insertion order, like the OrderedDict that
+    was pickled as a whole before.
+
+    .. autosummary::
+
+        reference
+        manifest
+        set_manifest
+        remove_manifest
+        sync
+        close
+
+    """
+    def __init__(self, path):
+        """
+        :param path: Path of the database file. A database pickled by older
+                     versions is migrated, the old file is kept as path.bak.
+
+        """
+        self._path = path
+        # key -> (movie, digest of the pickled movie when loaded or stored)
+        self._cache = {}
+
+        migrate = self._is_pickle_database(path)
+        if migrate:
+            os.replace(path, path + '.bak')
+
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS movies ('
+            'id INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, '
+            'data BLOB NOT NULL)'
+        )
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS manifest ('
+            'path TEXT PRIMARY KEY, key TEXT NOT NULL, mtime REAL, '
+            'size INTEGER, digest TEXT)'
+        )
+        self._connection.execute(
+            'CREATE INDEX IF NOT EXISTS manifest_key ON manifest (key)'
+        )
+        if migrate:
+            self._migrate(path + '.bak')
+        self._connection.commit()
+
+    def _is_pickle_database(self, path):
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(len(SQLITE_HEADER))
+        except FileNotFoundError:
+            return False
+        return bool(header) and header != SQLITE_HEADER
+
+    def _migrate(self, path):
+        """ Import all movies of a whole-file pickled database. """
+        try:
+            with open(path, 'rb') as f:
+                movies = _LegacyUnpickler(f).load()
+        except (pickle.UnpicklingError, EOFError) as e:
+            print('Error while migrating database.', e)
+            return
+
+        for movie in movies.values():
+            movie.__class__ = Movie
+        for key, movie in movies.items():
+            self[key] = movie
+        # the comparator data sets are still hashed by identity
+        self.sync(clear_cache=True)
+
+    def reference(self, key):
+        """ Return the movie if it is already loaded, a MovieRef otherwise. """
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached[0]
+        return MovieRef(self, key)
+
+    def manifest(self):
+        """ Return a metadata file -> (key, stamp) mapping of the last scan.
+
+        A stamp is a (mtime, size, digest) tuple.
+
+        """
+        rows = self._connection.execute(
+            'SELECT path, key, mtime, size, digest FROM manifest'
+        )
+        return {
+            path: (key, (mtime, size, digest))
+            for path, key, mtime, size, digest in rows
+        }
+
+    def set_manifest(self, path, key, stamp):
+        """ Set the stamp of the metadata file path of movie key. """
+        self._connection.execute(
+            'INSERT OR REPLACE INTO manifest (path, key, mtime, size, digest) '
+            'VALUES (?, ?, ?, ?, ?)', (path, key) + tuple(stamp)
+        )
+
+    def remove_manifest(self, path):
+        """ Remove the stamp of the metadata file path. """
+        self._connection.execute(
+            'DELETE FROM manifest WHERE path = ?', (path,)
+        )
+
+    def _dump(self, movie):
+        data = io.BytesIO()
+        _MoviePickler(data, movie).dump(movie)
+        return data.getvalue()
+
+    def _load(self, data):
+        return _MovieUnpickler(io.BytesIO(data), self).load()
+
+    def _digest(self, data):
+        return hashlib.sha1(data).digest()
+
+    def __getitem__(self, key):
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached[0]
+
+        row = self._connection.execute(
+            'SELECT data FROM movies WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        movie = self._load(row[0])
+        self._cache[key] = (movie, self._digest(row[0]))
+        return movie
+
+    def __setitem__(self, key, movie):
+        data = self._dump(movie)
+        self._write(key, data)
+        self._cache[key] = (movie, self._digest(data))
+
+    def __delitem__(self, key):
+        cursor = self._connection.execute(
+            'DELETE FROM movies WHERE key = ?', (key,)
+        )
+        self._connection.execute('DELETE FROM manifest WHERE key = ?', (key,))
+        self._cache.pop(key, None)
+        if not cursor.rowcount:
+            raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in self._cache or self._connection.execute(
+            'SELECT 1 FROM movies WHERE key = ?', (key,)
+        ).fetchone() is not None
+
+    def __iter__(self):
+        keys = self._connection.execute('SELECT key FROM movies ORDER BY id')
+        return iter([key for key, in keys])
+
+    def __len__(self):
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM movies'
+        ).fetchone()[0]
+
+    def _write(self, key, data):
+        self._connection.execute(
+            'INSERT INTO movies (key, data) VALUES (?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET data = excluded.data',
+            (key, data)
+        )
+
+    def sync(self, clear_cache=False):
+        """ Write back all modified movies and commit the transaction.
+
+        :param clear_cache: Drop all loaded movies afterwards. Movies that are
+                            still referenced elsewhere are not written back
+                            anymore on a later sync.
+
+        """
+        for key, (movie, digest) in list(self._cache.items()):
+            data = self._dump(movie)
+            new_digest = self._digest(data)
+            if new_digest != digest:
+                self._write(key, data)
+                self._cache[key] = (movie, new_digest)
+        self._connection.commit()
+        if clear_cache:
+            self._cache.clear()
+
+    def close(self):
+        """ Sync and close the database. """
+        self.sync()
+        self._connection.close()
+
+
+if __name__ == '__main__':
+    import unittest
+    import tempfile
+    import shutil
+    from collections import OrderedDict
+
+    class TestMovieDatabase(unittest.TestCase):
+
+        def setUp(self):
+            self._dir = tempfile.mkdtemp()
+            self._path = os.path.join(self._dir, 'movie.db')
+            self._db = MovieDatabase(self._path)
+            for name in ['alien', 'aliens', 'amelie']:
+                key = '/movies/' + name
+                self._db[key] = Movie(key, None, {'title': name})
+
+        def reopen(self):
+            self._db.close()
+            self._db = MovieDatabase(self._path)
+
+        def test_mapping(self):
+            self.assertEqual(len(self._db), 3)
+            self.assertEqual(list(self._db), [
+                '/movies/alien', '/movies/aliens', '/movies/amelie'
+            ])
+            self.assertTrue('/movies/alien' in self._db)
+            del self._db['/movies/alien']
+            self.assertFalse('/movies/alien' in self._db)
+            self.assertRaises(KeyError, self._db.__getitem__, '/movies/alien')
+            self.reopen()
+            self.assertEqual(len(self._db), 2)
+
+        def test_write_back(self):
+            self._db['/movies/alien'].analyzer_data['LangIdentify'] = 'en'
+            self.reopen()
+            self.assertEqual(
+                self._db['/movies/alien'].analyzer_data, {'LangIdentify': 'en'}
+            )
+
+        def test_references(self):
+            alien = self._db['/movies/alien']
+            aliens = self._db['/movies/aliens']
+            alien.comparator_data['GenreCmp'] = {(aliens, 1.0)}
+            aliens.comparator_data['GenreCmp'] = {(alien, 1.0)}
+            self.reopen()
+
+            (other, rating), = self._db['/movies/alien'].comparator_data[
+                'GenreCmp'
+            ]
+            self.assertTrue(isinstance(other, MovieRef))
+            self.assertEqual(other.attributes, {'title': 'aliens'})
+            (same, _), = other.comparator_data['GenreCmp']
+            self.assertTrue(same is self._db['/movies/alien'])
+
+        def test_manifest(self):
+            self._db.set_manifest('/movies/alien/a.nfo', '/movies/alien',
+                                  (1.5, 42, 'abc'))
+            self._db.set_manifest('/movies/amelie', '/movies/amelie',
+                                  (None, None, None))
+            self.reopen()
+            self.assertEqual(self._db.manifest(), {
+                '/movies/alien/a.nfo': ('/movies/alien', (1.5, 42, 'abc')),
+                '/movies/amelie': ('/movies/amelie', (None, None, None))
+            })
+            del self._db['/movies/alien']
+            self._db.remove_manifest('/movies/amelie')
+            self.assertEqual(self._db.manifest(), {})
+
+        def test_migrate(self):
+            path = os.path.join(self._dir, 'old.db')
+            movies = OrderedDict()
+            for name in ['b', 'a']:
+                movies[name] = Movie(name, None, {'title': name})
+            movies['a'].comparator_data['GenreCmp'] = {(movies['b'], 0.5)}
+            movies['b'].comparator_data['GenreCmp'] = {(movies['a'], 0.5)}
+            with open(path, 'wb') as f:
+                pickle.dump(movies, f)
+
+            db = MovieDatabase(path)
+            self.assertEqual(list(db), ['b', 'a'])
+            self.assertTrue(os.path.exists(path + '.bak'))
+            (other, _), = db['a'].comparator_data['GenreCmp']
+            self.assertEqual(other, db['b'])
+            self.assertEqual(other.attributes, {'title': 'b'})
+            self.assertEqual(type(db['b']), Movie)
+            db.close()
+
+        def test_no_duplicates(self):
+            alien = self._db['/movies/alien']
+            aliens = self._db['/movies/aliens']
+            alien.comparator_data['GenreCmp'] = {(aliens, 1.0)}
+            self.reopen()
+
+            alien = self._db['/movies/alien']
+            aliens = self._db['/movies/aliens']
+            alien.comparator_data['GenreCmp'].add((aliens, 1.0))
+            self.assertEqual(len(alien.comparator_data['GenreCmp']), 1)
+            self.assertEqual(
+                hash(aliens), hash(MovieRef(self._db, aliens.key))
+            )
+
+        def tearDown(self):
+            self._db.close()
+            shutil.rmtree(self._dir)
+
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Overview
+~~~~~~~~
+
+Shared language identification for analyzers and keyword extraction.
+
+Languages are identified by the trigram models of ``guess_language`` from a
+bounded prefix of the text. The spell checker backend (enchant) is not used,
+it is slow to initialize and its results depend on the installed
+dictionaries. Results are cached per text prefix, so a plot is identified
+only once per process, no matter how many analyzers need its language.
+"""
+
+# stdlib
+from functools import lru_cache
+
+# 3rd party
+import guess_language
+
+
+# Number of characters used for identification
+PREFIX_LENGTH = 1024
+LANGUAGE_CACHE_SIZE = 8192
+
+guess_language.use_enchant(False)
+
+
+def identify(text):
+    """ Return the ISO 639-1 language code of text.
+
+    :param text: Text to identify the language of.
+    :returns: A language code or None if the language is unknown.
+
+    """
+    if not text:
+        return None
+    return _identify_prefix(text[:PREFIX_LENGTH])
+
+
+def identify_batch(texts):
+    """ Return the language codes of texts, see :func:`identify`. """
+    return [identify(text) for text in texts]
+
+
+@lru_cache(maxsize=LANGUAGE_CACHE_SIZE)
+def _identify_prefix(prefix):
+    # guess_language returns a false UNKNOWN string for unknown languages
+    return guess_language.guess_language(prefix) or None
+
+
+if __name__ == '__main__':
+    import unittest
+
+    class TestLangId(unittest.TestCase):
+
+        def test_identify(self):
+            self.assertEqual(identify(
+                'Marv is a rough, scarred brute who lives in Sin City and '
+                'is looking for the killer of the only woman he ever loved.'
+            ), 'en')
+            self.assertEqual(identify(
+                'Marv ist ein hässlicher Schläger, der in Sin City lebt und '
+                'den Mörder der einzigen Frau sucht, die er je geliebt hat.'
+            ), 'de')
+            self.assertTrue(identify('') is None)
+            self.assertTrue(identify('Katzenbaum') is None)
+
+        def test_identify_batch(self):
+            texts = ['Ein Film über eine Katze, die auf einem Baum wohnt.'] * 3
+            self.assertEqual(identify_batch(texts), ['de'] * 3)
+
+    unittest.main()
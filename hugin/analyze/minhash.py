@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Overview
+~~~~~~~~
+
+Approximate "more like this" lookups using MinHash signatures and LSH.
+
+Every movie is described by a set of features built out of its genres,
+extracted keywords, directors and actors. The MinHash signature of this
+set estimates the jaccard similarity between two movies. Signatures are
+split into bands, movies with an identical band are put into the same
+bucket. A lookup only rates the movies sharing at least one bucket with the
+query movie, so lookups are independent of the library size.
+"""
+
+# stdlib
+from collections import defaultdict
+import random
+import pickle
+import zlib
+import os
+
+# hugin
+from hugin.utils.fileutil import atomic_write
+
+
+# A mersenne prime larger than the 32 bit feature hashes
+_PRIME = (1 << 61) - 1
+
+# movie attribute name -> feature prefix
+FEATURE_ATTRS = {
+    'genre': 'genre', 'director': 'director', 'directors': 'director',
+    'actors': 'actor'
+}
+
+
+class MinHashIndex:
+    """
+    A persistent MinHash/LSH index for similar movie lookups.
+
+    .. autosummary::
+
+        open
+        insert
+        remove
+        similar
+        sync
+        close
+
+    """
+    def __init__(
+            self, num_perm=64, bands=16, seed=42,
+            feature_attrs=FEATURE_ATTRS, keyword_analyzer='KeywordExtract'):
+        """
+        :param num_perm: Number of hash functions, length of a signature.
+        :param bands: Number of LSH bands, has to be a divisor of num_perm.
+        :param seed: Seed for the hash functions, has to be fixed to be able to
+                     compare persisted signatures.
+        :param feature_attrs: Mapping of movie attribute -> feature prefix.
+        :param keyword_analyzer: Analyzer to read keywords from.
+
+        """
+        if num_perm % bands:
+            raise ValueError('num_perm has to be a multiple of bands.')
+
+        self._path = None
+        self._rows = num_perm // bands
+        self._bands = bands
+        self._feature_attrs = feature_attrs
+        self._keyword_analyzer = keyword_analyzer
+
+        rand = random.Random(seed)
+        self._permutations = [
+            (rand.randrange(1, _PRIME), rand.randrange(0, _PRIME))
+            for _ in range(num_perm)
+        ]
+        self._signatures = {}
+        self._buckets = [defaultdict(set) for _ in range(bands)]
+        self._modified = False
+
+    def open(self, path):
+        """ Read the persisted signatures from path if it exists. """
+        self._path = path
+        try:
+            with open(path, 'rb') as f:
+                signatures = pickle.load(f)
+        except FileNotFoundError:
+            signatures = {}
+        except (pickle.UnpicklingError, EOFError) as e:
+            print('Error while reading similarity index.', e)
+            signatures = {}
+
+        for key, signature in signatures.items():
+            self._add_signature(key, signature)
+        self._modified = False
+
+    def sync(self):
+        """ Write all signatures atomically to disk if they were modified. """
+        if self._path is None:
+            print('Sync error, no open similarity index.')
+            return
+
+        if self._modified:
+            try:
+                atomic_write(
+                    self._path, lambda f: pickle.dump(self._signatures, f)
+                )
+                self._modified = False
+            except OSError as e:
+                print('Error while writing similarity index.', e)
+
+    def close(self):
+        """ Write all pending changes to disk and close the index. """
+        self.sync()
+        self._path = None
+
+    def insert(self, movie):
+        """ Insert a movie or update a already indexed movie.
+
+        Movies without any features are removed from the index.
+
+        """
+        self.remove(movie.key)
+        features = self.features(movie)
+        if features:
+            self._add_signature(movie.key, self.signature(features))
+
+    def remove(self, key):
+        """ Remove the movie with the given key from the index. """
+        signature = self._signatures.pop(key, None)
+        if signature is not None:
+            self._modified = True
+            for band, band_key in enumerate(self._band_keys(signature)):
+                bucket = self._buckets[band][band_key]
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[band][band_key]
+
+    def similar(self, key, amount=10):
+        """ Return the most similar movies for a already indexed movie.
+
+        :param key: Key of the movie similar movies are looked up for.
+        :param amount: Max. number of similar movies to be returned.
+        :returns: A list with (key, estimated similarity) tuples, most
+                  similar movie first.
+
+        """
+        signature = self._signatures.get(key)
+        if signature is None:
+            return []
+
+        candidates = set()
+        for band, band_key in enumerate(self._band_keys(signature)):
+            candidates |= self._buckets[band].get(band_key, set())
+        candidates.discard(key)
+
+        rated = [
+            (other, self._estimate(signature, self._signatures[other]))
+            for other in candidates
+        ]
+        rated.sort(key=lambda item: (-item[1], item[0]))
+        return rated[:amount]
+
+    def features(self, movie):
+        """ Return the feature set describing a movie. """
+        features = set()
+        for attr, prefix in self._feature_attrs.items():
+            values = movie.attributes.get(attr)
+            if isinstance(values, str):
+                values = [values]
+            for value in values or ():
+                if isinstance(value, (tuple, list)):
+                    # actors are (role, name) tuples
+                    value = value[-1]
+                if value:
+                    features.add('{}:{}'.format(prefix, value).lower())
+
+        for keyword in movie.analyzer_data.get(self._keyword_analyzer) or ():
+            features.add('keyword:{}'.format(' '.join(sorted(keyword))))
+        return features
+
+    def signature(self, features):
+        """ Return the MinHash signature of a feature set. """
+        hashes = [zlib.crc32(feature.encode('utf-8')) for feature in features]
+        return tuple(
+            min((a * value + b) % _PRIME for value in hashes)
+            for a, b in self._permutations
+        )
+
+    def _add_signature(self, key, signature):
+        self._signatures[key] = signature
+        self._modified = True
+        for band, band_key in enumerate(self._band_keys(signature)):
+            self._buckets[band][band_key].add(key)
+
+    def _band_keys(self, signature):
+        rows = self._rows
+        return [
+            signature[band * rows:(band + 1) * rows]
+            for band in range(self._bands)
+        ]
+
+    def _estimate(self, signature_a, signature_b):
+        """ Estimate the jaccard similarity of two signatures. """
+        equal = sum(1 for a, b in zip(signature_a, signature_b) if a == b)
+        return equal / len(signature_a)
+
+    def __len__(self):
+        return len(self._signatures)
+
+    def __contains__(self, key):
+        return key in self._signatures
+
+
+if __name__ == '__main__':
+    import unittest
+    import shutil
+    import tempfile
+    from hugin.analyze.movie import Movie
+
+    class TestMinHashIndex(unittest.TestCase):
+
+        def setUp(self):
+            self._path = tempfile.mkdtemp()
+            self._index = MinHashIndex()
+            self._index.open(os.path.join(self._path, 'movie.db.simindex'))
+            self._movies = {
+                'alien': (
+                    ['Horror', 'Science Fiction'], 'scott',
+                    [['space', 'ship'], ['alien'], ['crew']]
+                ),
+                'aliens': (
+                    ['Horror', 'Science Fiction', 'Action'], 'cameron',
+                    [['space', 'ship'], ['alien'], ['marines']]
+                ),
+                'amelie': (
+                    ['Komödie', 'Liebe/Romantik'], 'jeunet',
+                    [['paris'], ['cafe']]
+                )
+            }
+            for key, (genre, director, keywords) in self._movies.items():
+                movie = Movie(
+                    key, None, {'genre': genre, 'director': director}
+                )
+                movie.analyzer_data['KeywordExtract'] = keywords
+                self._index.insert(movie)
+
+        def test_similar(self):
+            similar = self._index.similar('alien')
+            self.assertEqual([key for key, _ in similar], ['aliens'])
+            self.assertTrue(0.0 < similar[0][1] < 1.0)
+            self.assertEqual(self._index.similar('katzenbaum'), [])
+
+        def test_update_remove(self):
+            movie = Movie('amelie', None, {
+                'genre': ['Horror', 'Science Fiction'], 'director': 'jeunet'
+            })
+            movie.analyzer_data['KeywordExtract'] = [
+                ['space', 'ship'], ['alien'], ['crew']
+            ]
+            self._index.insert(movie)
+            self.assertTrue('amelie' in dict(self._index.similar('alien')))
+            self._index.remove('amelie')
+            self.assertFalse('amelie' in self._index)
+            self.assertEqual(len(self._index), 2)
+
+        def test_persist(self):
+            self._index.close()
+            index = MinHashIndex()
+            index.open(os.path.join(self._path, 'movie.db.simindex'))
+            self.assertEqual(
+                index.similar('alien'), self._index.similar('alien')
+            )
+
+        def tearDown(self):
+            shutil.rmtree(self._path)
+
+    unittest.main()
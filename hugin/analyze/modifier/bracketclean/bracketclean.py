@@ -3,21 +3,18 @@
 
 # hugin
 import hugin.analyze as plugin
-import re
+from hugin.analyze.textclean import get_cleaner
 
 
 class BracketClean(plugin.IModifier):
 
     def modify(self, movie, attr_name='plot'):
-        plot = movie.attributes.get(attr_name)
-        if plot:
-            movie.attributes[attr_name] = re.sub(
-                '\s+\(.*?\)(\s*)', '\g<1>', plot
-            )
+        self.modify_all({movie.key: movie}, attr_name=attr_name)
 
-    def modify_all(self, db):
-        for movie in db.values():
-            self.movie(movie)
+    def modify_all(self, database, attr_name='plot'):
+        cleaner = get_cleaner(['brackets'])
+        for movie in database.values():
+            cleaner.clean_attributes(movie.attributes, [attr_name])
 
     def parameters(self):
         return {
@@ -8,26 +8,153 @@ from hugin.harvest.session import Session
 
 class PlotLangChange(plugin.IModifier):
 
+    # network bound, the harvest session already downloads in parallel
+    workers = 1
+
     def __init__(self):
-        self._session = Session()
+        self._session = None
+
+    def set_session(self, session):
+        """ Use a already created harvest session for all lookups.
+
+        :param session: A :class:`hugin.harvest.session.Session`.
+
+        """
+        self._session = session
 
     def modify(self, movie, attr_name='plot', change_to='en'):
-        query = self._session.create_query(
-            title=movie.attributes.get('title'),
-            providers=['tmdbmovie'],
-            amount=1,
-            language=change_to
+        self.modify_all(
+            {movie.key: movie}, attr_name=attr_name, change_to=change_to
         )
-        result = self._session.submit(query)
-        if result:
-            movie.attributes[attr_name] = result.pop()._result_dict.get('plot')
 
-    def modify_all(self, db):
-        for movie in db.values():
-            self.movie(movie)
+    def modify_all(self, database, attr_name='plot', change_to='en'):
+        """ Replace the plot of all movies by the tmdb plot in change_to.
+
+        All lookups are submitted asynchronously first, so the harvest session
+        processes them concurrently. Movies with a known imdbid are looked up
+        by imdbid, all others by title and year.
+
+        :param attr_name: Attribute the plot is stored in.
+        :param change_to: Language code of the wanted plot.
+
+        """
+        session = self._get_session()
+        pending = []
+        for movie in database.values():
+            query = self._create_query(session, movie, change_to)
+            if query is not None:
+                pending.append((movie, session.submit_async(query)))
+
+        for movie, future in pending:
+            result = future.result()
+            if result:
+                plot = result.pop()._result_dict.get('plot')
+                if plot:
+                    movie.attributes[attr_name] = plot
 
     def parameters(self):
         return {
             'attr_name': str,
             'change_to': str
         }
+
+##############################################################################
+# -------------------------- helper functions --------------------------------
+##############################################################################
+
+    def _get_session(self):
+        """ Return the injected session, create one on first use. """
+        if self._session is None:
+            self._session = Session(parallel_jobs=4)
+        return self._session
+
+    def _create_query(self, session, movie, language):
+        imdbid = movie.attributes.get('imdbid')
+        title = movie.attributes.get('title')
+        if imdbid:
+            params = {'imdbid': imdbid}
+        elif title:
+            params = {'title': title, 'year': self._year(movie)}
+        else:
+            return None
+
+        return session.create_query(
+            providers=['tmdbmovie'], amount=1, language=language, **params
+        )
+
+    def _year(self, movie):
+        """ Return the nfo year as int, the harvest ranking compares ints. """
+        try:
+            return int(movie.attributes.get('year'))
+        except (TypeError, ValueError):
+            return None
+
+
+if __name__ == '__main__':
+    import unittest
+    from concurrent.futures import Future
+    from hugin.harvest.query import Query
+    from hugin.analyze.movie import Movie
+
+    class FakeResult:
+        def __init__(self, plot):
+            self._result_dict = {'plot': plot}
+
+    class FakeSession:
+        """ Answers every query immediately with a fixed plot. """
+        def __init__(self):
+            self.queries = []
+
+        def create_query(self, **kwargs):
+            return Query(kwargs)
+
+        def submit_async(self, query):
+            self.queries.append(query)
+            future = Future()
+            if query['imdbid'] == 'tt0000000':
+                future.set_result([])
+            else:
+                future.set_result([FakeResult('plot in ' + query['language'])])
+            return future
+
+    class TestPlotLangChange(unittest.TestCase):
+
+        def setUp(self):
+            self._session = FakeSession()
+            self._modifier = PlotLangChange()
+            self._modifier.set_session(self._session)
+            self._database = {
+                'a': Movie('a', None, {'title': 'Alien', 'plot': 'x'}),
+                'b': Movie('b', None, {'imdbid': 'tt0090605', 'plot': 'x'}),
+                'c': Movie('c', None, {'imdbid': 'tt0000000', 'plot': 'x'}),
+                'd': Movie('d', None, {'plot': 'x'}),
+                'e': Movie('e', None, {'title': 'Drive', 'year': '2011'}),
+                'f': Movie('f', None, {'title': 'Drive', 'year': 'n/a'})
+            }
+
+        def test_modify_all(self):
+            self._modifier.modify_all(self._database, change_to='de')
+            plots = {
+                key: movie.attributes['plot']
+                for key, movie in self._database.items()
+            }
+            self.assertEqual(plots, {
+                'a': 'plot in de', 'b': 'plot in de', 'c': 'x', 'd': 'x',
+                'e': 'plot in de', 'f': 'plot in de'
+            })
+            self.assertEqual(
+                [query['imdbid'] for query in self._session.queries],
+                [None, 'tt0090605', 'tt0000000', None, None]
+            )
+            self.assertEqual(
+                [query.get('year') for query in self._session.queries],
+                [None, None, None, 2011, None]
+            )
+
+        def test_modify(self):
+            self._modifier.modify(self._database['a'])
+            self.assertEqual(
+                self._database['a'].attributes['plot'], 'plot in en'
+            )
+
+    unittest.main()
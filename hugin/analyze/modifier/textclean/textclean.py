@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+# hugin
+import hugin.analyze as plugin
+from hugin.analyze.textclean import get_cleaner, split_names, RULES
+
+
+class TextClean(plugin.IModifier):
+
+    def modify(self, movie, attr_name='plot', rules=':'.join(RULES)):
+        self.modify_all(
+            {movie.key: movie}, attr_name=attr_name, rules=rules
+        )
+
+    def modify_all(self, database, attr_name='plot', rules=':'.join(RULES)):
+        """ Clean text attributes of all movies with a compiled rule set.
+
+        :param attr_name: Attribute or colon separated attributes to clean.
+        :param rules: Colon separated rules, see
+                      :class:`hugin.analyze.textclean.TextCleaner`.
+
+        """
+        cleaner = get_cleaner(rules)
+        attr_names = split_names(attr_name)
+        for movie in database.values():
+            cleaner.clean_attributes(movie.attributes, attr_names)
+
+    def parameters(self):
+        return {
+            'attr_name': str,
+            'rules': str
+        }
+
+
+if __name__ == '__main__':
+    import unittest
+    from hugin.analyze.movie import Movie
+
+    class TestTextClean(unittest.TestCase):
+
+        def test_modify_all(self):
+            database = {
+                'a': Movie('a', None, {
+                    'title': 'Sin  City ', 'year': '2005',
+                    'plot': 'Marv (Mickey Rourke) &amp; Nancy.\n'
+                            'Quelle: Wikipedia'
+                }),
+                'b': Movie('b', None, {'title': None, 'plot': None})
+            }
+            TextClean().modify_all(database, attr_name='title:plot')
+            self.assertEqual(database['a'].attributes, {
+                'title': 'Sin City', 'plot': 'Marv & Nancy.', 'year': '2005'
+            })
+            self.assertEqual(
+                database['b'].attributes, {'title': None, 'plot': None}
+            )
+
+    unittest.main()
@@ -1,6 +1,7 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
+import hashlib
 import os
 
 
@@ -12,6 +13,39 @@ class Movie:
         self.attributes = attributes
         self.analyzer_data = {}
         self.comparator_data = {}
+        # plugin name -> (plugin stamp, fingerprint) of the last run
+        self.plugin_stamps = {}
+
+    def fingerprint(self, inputs=None):
+        """ Return a hash of the attributes and additional plugin inputs.
+
+        The fingerprint changes whenever the input of a plugin might change.
+        The nfo file is not part of it, a export rewrites the nfo file but
+        keeps the attributes.
+
+        :param inputs: Plugin specific inputs, e.g. movie file stats.
+
+        """
+        digest = hashlib.sha1(
+            repr(sorted(self.attributes.items())).encode('utf-8')
+        )
+        if inputs is not None:
+            digest.update(repr(inputs).encode('utf-8'))
+        return digest.hexdigest()
+
+    def __setstate__(self, state):
+        # databases pickled before plugin stamps were introduced
+        state.setdefault('plugin_stamps', {})
+        self.__dict__.update(state)
+
+    def __eq__(self, other):
+        # movies are equal to MovieRefs of the same key, see MovieRef.__eq__
+        if isinstance(other, Movie):
+            return self.key == other.key
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.key)
 
     def __repr__(self):
         head, tail = os.path.split(self.key)
@@ -79,6 +79,7 @@ class PluginHandler:
         for plugin in self._plugin_from_category[category]:
             plugin.plugin_object.name = plugin.name
             plugin.plugin_object.description = plugin.description
+            plugin.plugin_object.version = str(plugin.version)
             plugins.append(plugin.plugin_object)
         return plugins
 
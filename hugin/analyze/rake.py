@@ -33,20 +33,34 @@ Reference
 import re
 import operator
 
-from collections import deque, Counter, OrderedDict
-from itertools import combinations
+from collections import deque, Counter, OrderedDict, defaultdict
+from functools import lru_cache
+from itertools import repeat
 
 
 # 3rd party
 import Stemmer
-import guess_language
-guess_language.use_enchant(True)
 from pyxdameraulevenshtein import normalized_damerau_levenshtein_distance
 
 # hugin
 import hugin.analyze.stopwords
+from hugin.analyze.langid import identify
 
 
+WORD_DELIMITER = re.compile(r'[^\w+-/]')
+SENTENCE_DELIMITER = re.compile('[.!?,;:\t\\-\\"\\(\\)\\\'\u2019\u2013]')
+
+# Single pass tokenizer, a token is a word or a sentence delimiter. Sentence
+# delimiters are split off before words, so of the word characters
+# [\w+-/] only \w, + and / are left.
+TOKENIZER = re.compile('[\\w+/]+|[.!?,;:\t\\-"()\'\u2019\u2013]')
+SENTENCE_DELIMITERS = frozenset('.!?,;:\t-"()\'\u2019\u2013')
+
+# Matches a lower case word if and only if float() accepts it. Words never
+# contain a '.' or '-', so + is the only possible sign.
+NUMERIC = re.compile(
+    '\\+?(?:\\d(?:_?\\d)*(?:e\\+?\\d(?:_?\\d)*)?|inf(?:inity)?|nan)\\Z'
+)
 
 
 # This is a fallback for the case when no stemmer for a language was found:
@@ -56,6 +70,9 @@ class DummyStemmer:
     def stemWord(self, word):
         return word
 
+    def stemWords(self, words):
+        return words
+
 
 def separate_words(text):
     """Separate a text (or rather sentece) into words
@@ -66,7 +83,7 @@ def separate_words(text):
     :returns: an iterable of words.
     """
     words = deque()
-    for word in filter(None, re.split('[^\w+-/]', text)):
+    for word in filter(None, WORD_DELIMITER.split(text)):
         word = word.strip().lower()
         # Leave numbers in the phrase, but do not count them as words.
         try:
@@ -83,7 +100,7 @@ def split_sentences(text):
 
     :returns: an iterable of strings.
     """
-    return re.split('[.!?,;:\t\\-\\"\\(\\)\\\'\u2019\u2013]', text)
+    return SENTENCE_DELIMITER.split(text)
 
 
 def phrase_iter(sentence, stopwords, stemmer):
@@ -110,6 +127,24 @@ def phrase_iter(sentence, stopwords, stemmer):
         yield yield_result(phrase)
 
 
+@lru_cache(maxsize=None)
+def get_stemmer(language_code, use_stemmer=True):
+    """Return a shared stemmer for a language.
+
+    Stemmers are not thread safe, so they should only be used by one thread.
+
+    :param language_code: an ISO 639 language code
+    :param use_stemmer: If False a :class:`DummyStemmer` is returned.
+    """
+    try:
+        if use_stemmer:
+            return Stemmer.Stemmer(language_code)
+    except KeyError:
+        # effectively disable stemming:
+        pass
+    return DummyStemmer()
+
+
 def extract_phrases(sentences, language_code, use_stemmer):
     """Extract the phrases from all sentences.
 
@@ -126,15 +161,7 @@ def extract_phrases(sentences, language_code, use_stemmer):
     if not stopwords:
         return None
 
-    try:
-        if use_stemmer:
-            language_stemmer = Stemmer.Stemmer(language_code)
-        else:
-            language_stemmer = DummyStemmer()
-    except KeyError:
-        # effectively disable stemming:
-        language_stemmer = DummyStemmer()
-
+    language_stemmer = get_stemmer(language_code, use_stemmer)
     phrases = deque()
     for sentence in sentences:
         phrases += phrase_iter(sentence.strip(), stopwords, language_stemmer)
@@ -142,6 +169,65 @@ def extract_phrases(sentences, language_code, use_stemmer):
     return phrases
 
 
+def phrase_spans(text, stopwords, stemmer):
+    """Split a text into phrases with a single tokenizer pass.
+
+    Same result as :func:`extract_phrases` on :func:`split_sentences`, but
+    phrases are (start, end) index ranges into one list of stemmed words.
+
+    :param text: The text to split into phrases.
+    :param stopwords: A set of stopwords.
+    :param stemmer: A stemmer class to be used (language aware)
+    :returns: A (words, spans) tuple.
+    """
+    words, spans, start = [], [], 0
+    for token in TOKENIZER.findall(text):
+        if token not in SENTENCE_DELIMITERS:
+            token = token.lower()
+            # Leave numbers in the phrase, but do not count them as words.
+            if NUMERIC.match(token) is not None:
+                continue
+            if token not in stopwords:
+                words.append(token)
+                continue
+
+        # a sentence delimiter or stopword ends the current phrase
+        if len(words) > start:
+            spans.append((start, len(words)))
+            start = len(words)
+
+    if len(words) > start:
+        spans.append((start, len(words)))
+    return stemmer.stemWords(words), spans
+
+
+def span_keywordscores(words, spans):
+    """Same as :func:`candidate_keywordscores` of :func:`word_scores`, but
+    for phrases as spans, see :func:`phrase_spans`.
+    """
+    freqs, degrees = Counter(), Counter()
+    for start, end in spans:
+        degree = end - start
+        for index in range(start, end):
+            word = words[index]
+            freqs[word] += 1
+            degrees[word] += degree
+
+    wordscore = {word: degrees[word] / freq for word, freq in freqs.items()}
+    candidates = {}
+    for start, end in spans:
+        score = 0
+        for index in range(start, end):
+            score += wordscore[words[index]]
+        candidates[tuple(words[start:end])] = score
+
+    return OrderedDict(sorted(
+        candidates.items(),
+        key=operator.itemgetter(1),
+        reverse=True
+    ))
+
+
 def word_scores(phrases):
     """Calculate the scores of each individual word, depending on the phrase length.
 
@@ -182,24 +268,49 @@ def candidate_keywordscores(phrases, wordscore):
 def filter_subsets(keywords):
     """Remove keywordsets that are a subset of larger sets.
     This modifies it's input, but returns it for convinience.
+
+    Of several keywords with the same set of words only the last one is kept.
+    Supersets are found by intersecting the postings of a word -> word sets
+    index, starting with the rarest word, instead of comparing all pairs.
+
     :returns: keywords, the modified input.
     """
-    to_delete = deque()
-    for keyword_a, keyword_b in combinations(keywords.keys(), 2):
-        set_a, set_b = frozenset(keyword_a), frozenset(keyword_b)
-
-        if set_a.issubset(set_b):
-            to_delete.append(keyword_a)
-        elif set_b.issubset(set_a):
-            to_delete.append(keyword_b)
-        #elif issubset_levenshtein(keyword_a, keyword_b):
-        #    to_delete.append(decide_which_to_delete(keyword_a, keyword_b))
-
-    for sub_keywords in set(to_delete):
+    # word set -> last keyword with this word set
+    last_keywords = {}
+    for keyword in keywords:
+        last_keywords[frozenset(keyword)] = keyword
+
+    postings = defaultdict(set)
+    for word_set in last_keywords:
+        for word in word_set:
+            postings[word].add(word_set)
+
+    to_delete = [
+        keyword for keyword in keywords
+        if last_keywords[frozenset(keyword)] != keyword
+    ]
+    for word_set, keyword in last_keywords.items():
+        if not word_set:
+            # the empty set is a subset of every other set
+            if len(last_keywords) > 1:
+                to_delete.append(keyword)
+            continue
+
+        words = sorted(word_set, key=lambda word: len(postings[word]))
+        supersets = postings[words[0]]
+        for word in words[1:]:
+            if len(supersets) == 1:
+                break
+            supersets = supersets & postings[word]
+        if len(supersets) > 1:
+            to_delete.append(keyword)
+
+    for sub_keywords in to_delete:
         del keywords[sub_keywords]
 
     return keywords
 
+
 def decide_which_to_delete(set_a, set_b):
     """Return the longer of two sets, or if they have the same size, the one
     with the shorter (and thus more comparable) words.
@@ -227,23 +338,57 @@ def issubset_levenshtein(set_a, set_b, threshold=0.4):
 
     distance = dist_sum / len(larger)
     return distance <= 0.3
-def extract_keywords(text, use_stemmer=True):
+def extract_keywords(text, use_stemmer=True, language=None):
     """Extract the keywords from a certain text.
 
     :param use_stemmer: If True a Snowball Stemmer will be used for all words.
+    :param language: ISO 639 language code of text, guessed if None.
     :returns: A sorted mapping between a set of keywords and their rating.
     :rtype: :class:`collections.OrderedDict`
     """
-    language_code = guess_language.guess_language(text)
-    phrases = extract_phrases(split_sentences(text), language_code, use_stemmer)
+    language_code = language or identify(text)
+    if language_code is None:
+        # empty text or a language that could not be identified
+        return None, OrderedDict()
+
+    stopwords = hugin.analyze.stopwords.load_stopwords(language_code)
 
     # This can happen if no stopwords are avaible, or a one-word input was used.
-    if phrases is None:
+    if not stopwords:
         return None, OrderedDict()
 
-    scores = word_scores(phrases)
-    keywords = candidate_keywordscores(phrases, scores)
-    return language_code, keywords
+    words, spans = phrase_spans(
+        text, stopwords, get_stemmer(language_code, use_stemmer)
+    )
+    return language_code, span_keywordscores(words, spans)
+
+
+def extract_keywords_batch(texts, use_stemmer=True, languages=None):
+    """Extract the keywords of many texts, see :func:`extract_keywords`.
+
+    Stemmers and stopwords are shared between all texts, duplicate texts
+    are only processed once.
+
+    :param texts: An iterable of texts.
+    :param languages: An optional iterable with the ISO 639 language code
+                      of every text, None entries are guessed.
+    :returns: A list of (language_code, keywords) tuples, one per text.
+    """
+    if languages is None:
+        languages = repeat(None)
+
+    results, known = [], {}
+    for text, language in zip(texts, languages):
+        if (text, language) in known:
+            language_code, keywords = known[(text, language)]
+            keywords = OrderedDict(keywords)
+        else:
+            language_code, keywords = extract_keywords(
+                text, use_stemmer, language
+            )
+            known[(text, language)] = language_code, keywords
+        results.append((language_code, keywords))
+    return results
 
 
 ###########################################################################
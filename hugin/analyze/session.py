@@ -3,12 +3,22 @@
 
 # stdlib
 import os
-import pickle
-from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 # hugin
 from hugin.analyze.movie import Movie
+from hugin.analyze.database import MovieDatabase
+from hugin.analyze.minhash import MinHashIndex
 from hugin.analyze.pluginhandler import PluginHandler
+from hugin.filewalk import rescan_metadata, data_export, UNCHANGED
+
+
+# Number of chunks per worker if a plugin does not define a chunksize
+CHUNKS_PER_WORKER = 4
+
+# (category, pluginname) -> plugin, plugins loaded by a worker process
+WORKER_PLUGIN_CACHE = {}
 
 
 class Session:
@@ -17,6 +27,9 @@ class Session:
         self._dbname = database
         self._database = self.database_open(database)
         self._mask = attr_mask
+        self._similarity_index = MinHashIndex()
+        self._similarity_index.open(database + '.simindex')
+        self._cache_path = database + '.cache'
 
         self._plugin_handler = PluginHandler()
         self._plugin_handler.activate_plugins_by_category('Analyzer')
@@ -32,6 +45,8 @@ class Session:
         self._comparator = self._plugin_handler.get_plugins_from_category(
             'Comparator'
         )
+        for plugin in self._analyzer + self._modifier:
+            plugin.cache_path = self._cache_path
 
     def analyze_raw(self, plugin, attr, data):
         attributes = {attr: data}
@@ -51,20 +66,283 @@ class Session:
         plugin.compare(movie)
         return movie.attributes[attr]
 
+    def analyze_all(
+            self, plugin, workers=None, chunksize=None, force=False,
+            **kwargs):
+        """ Run a analyzer plugin on all movies of the database.
+
+        The database is split into chunks which are passed to the plugins
+        analyze_all method in worker processes, the analyzer data is merged
+        back afterwards. With a single worker the plugin runs in-process.
+
+        Movies already analyzed with the same plugin version and parameters
+        are skipped if their fingerprint, see
+        :func:`hugin.analyze.movie.Movie.fingerprint`, and the inputs given
+        by the plugins input_stamp method did not change. Movies the plugins
+        failed method reports are processed again on the next run.
+
+        :param plugin: A analyzer plugin, see :func:`analyzer_plugins`.
+        :param workers: Number of worker processes, defaults to the plugins
+                        workers attribute or the number of cpus.
+        :param chunksize: Number of movies per worker task, defaults to the
+                          plugins chunksize attribute.
+        :param force: Also process unchanged movies.
+        :param kwargs: Parameters passed to the plugins analyze method.
+        :returns: The list of processed movies.
+
+        """
+        return self._run_all(
+            plugin, 'Analyzer', 'analyze_all', workers, chunksize, force,
+            kwargs
+        )
+
+    def modify_all(
+            self, plugin, workers=None, chunksize=None, force=False,
+            **kwargs):
+        """ Run a modifier plugin on all movies of the database.
+
+        Same as :func:`analyze_all`, but for modifier plugins.
+
+        """
+        return self._run_all(
+            plugin, 'Modifier', 'modify_all', workers, chunksize, force,
+            kwargs
+        )
+
+    def _run_all(
+            self, plugin, category, method, workers, chunksize, force,
+            kwargs):
+        stamp = self._plugin_stamp(plugin, kwargs)
+        movies = [
+            movie for movie in self._database.values()
+            if force or movie.plugin_stamps.get(plugin.name) !=
+            (stamp, movie.fingerprint(plugin.input_stamp(movie)))
+        ]
+        self._run_plugin(plugin, category, method, workers, chunksize,
+                         movies, kwargs)
+
+        # fingerprint after the run, modifiers change the attributes
+        for movie in movies:
+            if plugin.failed(movie):
+                movie.plugin_stamps.pop(plugin.name, None)
+            else:
+                movie.plugin_stamps[plugin.name] = (
+                    stamp, movie.fingerprint(plugin.input_stamp(movie))
+                )
+        self.update_similarity_index(movies)
+        self._sync()
+        return movies
+
+    def _sync(self, clear_cache=False):
+        """ Write the similarity index, then commit the database.
+
+        Stamped movies are skipped on the next run, so their index entries
+        have to be on disk before the stamps are.
+
+        """
+        self._similarity_index.sync()
+        self._database.sync(clear_cache=clear_cache)
+
+    def _plugin_stamp(self, plugin, kwargs):
+        """ Plugin version and parameters, a change invalidates results. """
+        return plugin.version, repr(sorted(kwargs.items()))
+
+    def _run_plugin(
+            self, plugin, category, method, workers, chunksize, movies,
+            kwargs):
+        workers = workers or plugin.workers or os.cpu_count() or 1
+        workers = min(workers, len(movies))
+        if workers <= 1:
+            getattr(plugin, method)(_as_database(movies), **kwargs)
+            return
+
+        chunksize = chunksize or plugin.chunksize or max(
+            1, -(-len(movies) // (workers * CHUNKS_PER_WORKER))
+        )
+        chunks = [
+            [_detach_movie(movie) for movie in movies[i:i + chunksize]]
+            for i in range(0, len(movies), chunksize)
+        ]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(
+                _process_chunk, repeat(category), repeat(plugin.name),
+                repeat(method), repeat(kwargs), chunks
+            )
+            for chunk in results:
+                for key, attributes, analyzer_data in chunk:
+                    movie = self._database[key]
+                    movie.attributes = attributes
+                    movie.analyzer_data = analyzer_data
+
     def add(self, metadata_file, helper):
-        attrs_mask = {key: None for key in self._mask.keys()}
         if os.path.isdir(metadata_file):
             # there is no metadata_file, so we get the directory
-            movie = Movie(metadata_file, None, attrs_mask)
+            self._add_movie(metadata_file, None, None)
         else:
             # we have a metadata_file, so we can get the directory
-            helper_attrs = helper(metadata_file, self._mask)
-            if helper_attrs is None:
-                helper_attrs = attrs_mask
-            movie = Movie(
-                os.path.dirname(metadata_file), metadata_file, helper_attrs
+            self._add_movie(
+                os.path.dirname(metadata_file), metadata_file,
+                helper(metadata_file, self._mask)
             )
+
+    def add_batch(self, metadata, batch_size=500):
+        """ Add movies from a stream of already imported metadata.
+
+        The database is synced every batch_size movies and the loaded movies
+        are dropped, so the stream is never held in memory as a whole.
+
+        :param metadata: Iterable of (key, nfo, attributes) tuples, see
+                         :func:`hugin.filewalk.import_metadata`.
+        :param batch_size: Number of movies per database transaction.
+        :returns: The number of added movies.
+
+        """
+        count = 0
+        for count, (key, nfo, attributes) in enumerate(metadata, 1):
+            self._add_movie(key, nfo, attributes)
+            if not count % batch_size:
+                self._sync(clear_cache=True)
+        self._sync(clear_cache=True)
+        return count
+
+    def rescan(self, roots, helper, batch_size=500, **kwargs):
+        """ Synchronize the database with the movie folders in roots.
+
+        Only new and changed nfo files are read, see
+        :func:`hugin.filewalk.rescan_metadata`. Movies of roots whose folder
+        does not exist anymore are removed. Movies added without a scan, e.g.
+        by :func:`add_batch`, only get a manifest entry if their nfo file is
+        unchanged.
+
+        :param roots: A library path or a list of library paths.
+        :param helper: Function reading the attributes of a nfo file.
+        :param batch_size: Number of movies per database transaction.
+        :param kwargs: Passed to :func:`hugin.filewalk.rescan_metadata`.
+        :returns: A dict with the 'added', 'updated' and 'removed' keys.
+
+        """
+        if isinstance(roots, str):
+            roots = [roots]
+
+        manifest = self._database.manifest()
+        stamps = {path: stamp for path, (_, stamp) in manifest.items()}
+        report = {'added': [], 'updated': [], 'removed': []}
+        seen_paths, seen_keys = set(), set()
+        scan = rescan_metadata(roots, self._mask, stamps, helper, **kwargs)
+        for count, (key, nfo, stamp, attributes) in enumerate(scan, 1):
+            seen_paths.add(nfo or key)
+            seen_keys.add(key)
+            if attributes is UNCHANGED:
+                # touched but unchanged nfo files get their new mtime, so
+                # they are not hashed again on the next rescan
+                if tuple(stamp) != tuple(stamps.get(nfo or key) or ()):
+                    self._database.set_manifest(nfo or key, key, stamp)
+                continue
+
+            if key in self._database:
+                if self._is_unscanned(key, nfo, attributes, stamps):
+                    # added without manifest entry, e.g. by add_batch
+                    self._database.set_manifest(nfo or key, key, stamp)
+                    continue
+                self._update_movie(key, nfo, attributes)
+                report['updated'].append(key)
+            else:
+                self._add_movie(key, nfo, attributes)
+                report['added'].append(key)
+            self._database.set_manifest(nfo or key, key, stamp)
+            if not count % batch_size:
+                self._sync(clear_cache=True)
+
+        scanned_roots = {os.path.normpath(root) for root in roots}
+        for path, (key, _) in manifest.items():
+            if path in seen_paths:
+                continue
+            self._database.remove_manifest(path)
+            in_roots = os.path.normpath(os.path.dirname(key)) in scanned_roots
+            if in_roots and key not in seen_keys and key in self._database:
+                self.remove(key)
+                report['removed'].append(key)
+
+        self._sync(clear_cache=True)
+        return report
+
+    def export(self, mask=None, **kwargs):
+        """ Export the attributes of all movies to their nfo files.
+
+        The manifest stamps of the exported nfo files are updated, so the
+        next :func:`rescan` does not read them again.
+
+        :param mask: Attribute mask, see :func:`hugin.filewalk.attr_mapping`.
+        :param kwargs: Passed to :func:`hugin.filewalk.data_export`.
+        :returns: The counts returned by :func:`hugin.filewalk.data_export`.
+
+        """
+        movies = list(self._database.values())
+        stamps = {}
+        counts = data_export(movies, mask, stamps=stamps, **kwargs)
+
+        manifest = self._database.manifest()
+        for movie in movies:
+            stamp = stamps.get(movie.nfo)
+            if stamp is not None and manifest.get(movie.nfo) != (
+                    movie.key, stamp):
+                self._database.set_manifest(movie.nfo, movie.key, stamp)
+        self._sync()
+        return counts
+
+    def _is_unscanned(self, key, nfo, attributes, stamps):
+        """ Check if a movie without manifest entry matches its nfo file. """
+        if (nfo or key) in stamps:
+            return False
+        movie = self._database[key]
+        return movie.nfo == nfo and (
+            movie.attributes == (attributes or self._empty_attrs())
+        )
+
+    def remove(self, key):
+        """ Remove the movie with the given key from the database. """
+        del self._database[key]
+        self._similarity_index.remove(key)
+
+    def _update_movie(self, key, nfo, attributes):
+        movie = self._database[key]
+        movie.nfo, movie.attributes = nfo, attributes or self._empty_attrs()
+        self._similarity_index.insert(movie)
+
+    def _empty_attrs(self):
+        return {attr: None for attr in self._mask.keys()}
+
+    def _add_movie(self, key, nfo, attributes):
+        movie = Movie(key, nfo, attributes or self._empty_attrs())
         self._database[movie.key] = movie
+        self._similarity_index.insert(movie)
+
+    def similar_movies(self, key, amount=10):
+        """ Return the movies most similar to the movie with the given key.
+
+        Similarity is estimated by genre, keywords, directors and actors.
+
+        :param key: Key of the movie to look up similar movies for.
+        :param amount: Max. number of similar movies.
+        :returns: A list with (movie, similarity) tuples.
+
+        """
+        return [
+            (self._database[other], similarity) for other, similarity in
+            self._similarity_index.similar(key, amount)
+            if other in self._database
+        ]
+
+    def update_similarity_index(self, movies=None):
+        """ Reindex movies, e.g. after keywords have been extracted.
+
+        :param movies: Movies to be reindexed, defaults to all movies.
+
+        """
+        if movies is None:
+            movies = self._database.values()
+        for movie in movies:
+            self._similarity_index.insert(movie)
 
     def stats(self):
         return "Database: {}, Entries: {}\n".format(
@@ -72,6 +350,11 @@ class Session:
         )
 
     def get_database(self):
+        """ Return the database as a key -> movie mapping.
+
+        See :class:`hugin.analyze.database.MovieDatabase`.
+
+        """
         return self._database
 
     def analyzer_plugins(self, pluginname=None):
@@ -92,12 +375,265 @@ class Session:
                     return plugin
 
     def database_open(self, database):
-        try:
-            with open(self._dbname, 'rb') as f:
-                return pickle.load(f)
-        except FileNotFoundError as e:
-            return OrderedDict()
+        return MovieDatabase(database)
 
     def database_close(self):
-        with open(self._dbname, 'wb') as f:
-            pickle.dump(self._database, f)
+        self._database.close()
+        self._similarity_index.close()
+
+
+##############################################################################
+# -------------------------- worker functions --------------------------------
+##############################################################################
+
+def _as_database(movies):
+    """ Key -> movie mapping of movies, passed to the plugins *_all methods.
+    """
+    return {movie.key: movie for movie in movies}
+
+
+def _detach_movie(movie):
+    """ Copy of movie without comparator data, which references other movies
+    and would drag the whole database into every worker task.
+    """
+    detached = Movie(movie.key, movie.nfo, movie.attributes)
+    detached.analyzer_data = movie.analyzer_data
+    return detached
+
+
+def _worker_plugin(category, pluginname):
+    """ Load and cache a plugin inside a worker process. """
+    key = (category, pluginname)
+    if key not in WORKER_PLUGIN_CACHE:
+        handler = PluginHandler()
+        handler.activate_plugins_by_category(category)
+        for plugin in handler.get_plugins_from_category(category):
+            if plugin.name == pluginname:
+                WORKER_PLUGIN_CACHE[key] = plugin
+    return WORKER_PLUGIN_CACHE[key]
+
+
+def _process_chunk(category, pluginname, method, kwargs, movies):
+    """ Run a plugin on a chunk of movies, executed by a worker process.
+
+    :returns: A list with (key, attributes, analyzer_data) tuples.
+
+    """
+    plugin = _worker_plugin(category, pluginname)
+    getattr(plugin, method)(_as_database(movies), **kwargs)
+    return [
+        (movie.key, movie.attributes, movie.analyzer_data) for movie in movies
+    ]
+
+
+if __name__ == '__main__':
+    import unittest
+    import tempfile
+    import shutil
+    from hugin.filewalk import attr_import_func, import_metadata
+
+    class TestSession(unittest.TestCase):
+
+        def setUp(self):
+            self._path = tempfile.mkdtemp()
+            self._session = Session(
+                os.path.join(self._path, 'movie.db'),
+                attr_mask={'title': 'title'}
+            )
+            for num in range(20):
+                key = '/movies/{}'.format(num)
+                self._session.get_database()[key] = Movie(key, None, {
+                    'plot': 'A (very) short plot  (number {})'.format(num)
+                })
+
+        def plots(self):
+            return [
+                movie.attributes['plot']
+                for movie in self._session.get_database().values()
+            ]
+
+        def test_modify_all(self):
+            plugin = self._session.modifier_plugins('bracketclean')
+            expected = []
+            for plot in self.plots():
+                movie = Movie(None, None, {'plot': plot})
+                plugin.modify(movie)
+                expected.append(movie.attributes['plot'])
+
+            self._session.modify_all(plugin, workers=2, chunksize=3)
+            self.assertEqual(self.plots(), expected)
+            self.assertEqual(expected[0], 'A short plot')
+
+        def test_analyze_all(self):
+            plugin = self._session.analyzer_plugins('langidentify')
+            expected = []
+            for plot in self.plots():
+                movie = Movie(None, None, {'plot': plot})
+                plugin.analyze(movie)
+                expected.append(movie.analyzer_data)
+
+            self._session.analyze_all(plugin, workers=2)
+            self.assertEqual([
+                movie.analyzer_data
+                for movie in self._session.get_database().values()
+            ], expected)
+
+        def test_add_batch(self):
+            metadata = (
+                ('/new/{}'.format(num), None, None if num % 2 else
+                 {'title': str(num)}) for num in range(5)
+            )
+            self.assertEqual(self._session.add_batch(metadata, 2), 5)
+            database = self._session.get_database()
+            self.assertEqual(len(database), 25)
+            self.assertEqual(database['/new/1'].attributes, {'title': None})
+            self.assertEqual(database['/new/2'].attributes, {'title': '2'})
+
+        def test_add_batch_rescan(self):
+            root = os.path.join(self._path, 'library')
+            for name in ['a', 'b', 'c']:
+                os.makedirs(os.path.join(root, name))
+                with open(os.path.join(root, name, 'movie.nfo'), 'w') as f:
+                    f.write('<movie><title>{}</title></movie>'.format(name))
+            os.makedirs(os.path.join(root, 'd'))
+            self._session.add_batch(
+                import_metadata(root, {'title': 'title'})
+            )
+
+            # only the changed nfo file of the imported movies is updated
+            with open(os.path.join(root, 'a', 'movie.nfo'), 'w') as f:
+                f.write('<movie><title>changed</title></movie>')
+            report = self._session.rescan(root, attr_import_func)
+            self.assertEqual(report, {
+                'added': [], 'updated': [os.path.join(root, 'a')],
+                'removed': []
+            })
+            self.assertEqual(len(self._session._database.manifest()), 4)
+
+        def test_rescan(self):
+            root = os.path.join(self._path, 'library')
+            for name in ['a', 'b', 'c']:
+                os.makedirs(os.path.join(root, name))
+                with open(os.path.join(root, name, 'movie.nfo'), 'w') as f:
+                    f.write('<movie><title>{}</title></movie>'.format(name))
+
+            def keys(report):
+                return {
+                    change: sorted(os.path.basename(key) for key in keys)
+                    for change, keys in report.items()
+                }
+
+            report = self._session.rescan(root, attr_import_func)
+            self.assertEqual(keys(report), {
+                'added': ['a', 'b', 'c'], 'updated': [], 'removed': []
+            })
+            report = self._session.rescan(root, attr_import_func)
+            self.assertEqual(keys(report), {
+                'added': [], 'updated': [], 'removed': []
+            })
+
+            # touched, but unchanged nfo files get a new manifest stamp
+            path = os.path.join(root, 'c', 'movie.nfo')
+            os.utime(path, (1.0, 1.0))
+            self._session.rescan(root, attr_import_func)
+            _, (mtime, _, _) = self._session._database.manifest()[path]
+            self.assertEqual(mtime, 1.0)
+
+            with open(os.path.join(root, 'a', 'movie.nfo'), 'w') as f:
+                f.write('<movie><title>changed</title></movie>')
+            shutil.rmtree(os.path.join(root, 'b'))
+            report = self._session.rescan(root, attr_import_func)
+            self.assertEqual(keys(report), {
+                'added': [], 'updated': ['a'], 'removed': ['b']
+            })
+            database = self._session.get_database()
+            self.assertEqual(
+                database[os.path.join(root, 'a')].attributes['title'],
+                'changed'
+            )
+            self.assertEqual(len(database), 22)
+
+            # exported nfo files are not read again by the next rescan
+            database[os.path.join(root, 'c')].attributes['title'] = 'export'
+            counts = self._session.export({'title': 'title'})
+            self.assertEqual((counts['written'], counts['skipped']), (2, 20))
+            read = []
+
+            def helper(nfo, mask):
+                read.append(nfo)
+                return attr_import_func(nfo, mask)
+
+            report = self._session.rescan(root, helper)
+            self.assertEqual(keys(report), {
+                'added': [], 'updated': [], 'removed': []
+            })
+            self.assertEqual(read, [])
+
+        def test_incremental(self):
+            plugin = self._session.analyzer_plugins('langidentify')
+            self.assertEqual(len(self._session.analyze_all(plugin)), 20)
+            self.assertEqual(self._session.analyze_all(plugin), [])
+
+            movie = self._session.get_database()['/movies/3']
+            movie.attributes['plot'] = 'Ein ganz anderer Plot.'
+            self.assertEqual(self._session.analyze_all(plugin), [movie])
+            self.assertEqual(
+                len(self._session.analyze_all(plugin, attr_name='title')), 20
+            )
+            self.assertEqual(
+                len(self._session.analyze_all(
+                    plugin, attr_name='title', force=True
+                )), 20
+            )
+
+            # plugin inputs besides the attributes, e.g. movie files
+            stamps = {'/movies/3': 1}
+            plugin.input_stamp = lambda movie: stamps.get(movie.key)
+            self.assertEqual(len(self._session.analyze_all(plugin)), 20)
+            self.assertEqual(self._session.analyze_all(plugin), [])
+            stamps['/movies/3'] = 2
+            self.assertEqual(self._session.analyze_all(plugin), [movie])
+            del plugin.input_stamp
+
+            # failed movies are not stamped, they run again
+            plugin.failed = lambda movie: movie.key == '/movies/5'
+            self.assertEqual(
+                len(self._session.analyze_all(plugin, force=True)), 20
+            )
+            self.assertEqual(
+                [movie.key for movie in self._session.analyze_all(plugin)],
+                ['/movies/5']
+            )
+            del plugin.failed
+            self.assertEqual(
+                plugin.cache_path, os.path.join(self._path, 'movie.db.cache')
+            )
+
+            # a modified movie is not modified again
+            plugin = self._session.modifier_plugins('bracketclean')
+            self.assertEqual(len(self._session.modify_all(plugin)), 20)
+            self.assertEqual(self._session.modify_all(plugin), [])
+
+        def test_similarity_index_synced(self):
+            database = self._session.get_database()
+            for num in range(3):
+                database['/movies/{}'.format(num)].attributes['genre'] = [
+                    'Horror'
+                ]
+            plugin = self._session.modifier_plugins('bracketclean')
+            self._session.modify_all(plugin)
+
+            # the index is on disk with the stamps, without database_close
+            index = MinHashIndex()
+            index.open(os.path.join(self._path, 'movie.db.simindex'))
+            self.assertEqual(len(index), 3)
+            self.assertEqual(
+                [key for key, _ in index.similar('/movies/0')],
+                ['/movies/1', '/movies/2']
+            )
+
+        def tearDown(self):
+            self._session.database_close()
+            shutil.rmtree(self._path)
+
+    unittest.main()
@@ -9,7 +9,7 @@ Interface for loading stopwords from a set of 12 languages that
 are packaged along libmunin.
 
 The stopwords can be used to split text into important and unimportant words.
-Additionally text language can be guessed through the ``guess_language`` module.
+Additionally text language can be guessed through :mod:`hugin.analyze.langid`.
 
 Reference
 ~~~~~~~~~
@@ -17,8 +17,12 @@ Reference
 
 
 import os
+import mmap
+import struct
 import pkgutil
 
+from hugin.utils.fileutil import atomic_write
+
 
 __path__ = os.path.dirname(pkgutil.extend_path(__file__, __name__))
 
@@ -26,6 +30,92 @@ __path__ = os.path.dirname(pkgutil.extend_path(__file__, __name__))
 # Cache all already loaded stopwords, since loading them takes a tad longer.
 STOPWORD_CACHE = {}
 
+# The compiled stopword table of all languages, see :func:`compile_stopwords`
+STOPWORD_TABLE_PATH = os.path.join(__path__, 'data', 'stopwords.table')
+STOPWORD_TABLE = None
+
+# Set to load all stopwords on import, e.g. for long running services
+WARMUP_ENV = 'HUGIN_STOPWORDS_WARMUP'
+
+TABLE_MAGIC = b'HSW1'
+TABLE_HEADER = struct.Struct('<4sI')
+TABLE_ENTRY = struct.Struct('<8sII')
+TABLE_OFFSET = struct.Struct('<I')
+
+
+class StopwordTable:
+    """
+    Read only, memory mapped stopword table of all languages.
+
+    Every language has an array of word offsets followed by its sorted,
+    newline terminated, utf-8 encoded words. The file is mapped, so all
+    processes share its pages.
+
+    .. autosummary::
+
+        languages
+        words
+        contains
+        close
+
+    """
+    def __init__(self, path=STOPWORD_TABLE_PATH):
+        with open(path, 'rb') as handle:
+            self._mmap = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, count = TABLE_HEADER.unpack_from(self._mmap, 0)
+        if magic != TABLE_MAGIC:
+            raise ValueError('Not a stopword table: {}'.format(path))
+
+        # language code -> (offset of the word offsets, number of words)
+        self._languages = {}
+        for num in range(count):
+            code, index, size = TABLE_ENTRY.unpack_from(
+                self._mmap, TABLE_HEADER.size + num * TABLE_ENTRY.size
+            )
+            self._languages[code.rstrip(b'\0').decode('ascii')] = index, size
+
+    def languages(self):
+        """ Return all language codes of the table. """
+        return list(self._languages)
+
+    def _word(self, index, num):
+        start, end = struct.unpack_from(
+            '<II', self._mmap, index + num * TABLE_OFFSET.size
+        )
+        # without the terminating newline
+        return self._mmap[start:end - 1]
+
+    def words(self, language_code):
+        """ Return a frozenset of all stopwords of a language or None. """
+        if language_code not in self._languages:
+            return None
+        index, size = self._languages[language_code]
+        if not size:
+            return frozenset()
+        start, = TABLE_OFFSET.unpack_from(self._mmap, index)
+        end, = TABLE_OFFSET.unpack_from(
+            self._mmap, index + size * TABLE_OFFSET.size
+        )
+        return frozenset(
+            self._mmap[start:end - 1].decode('utf-8').split('\n')
+        )
+
+    def contains(self, language_code, word):
+        """ Binary search word without loading all stopwords of a language. """
+        index, size = self._languages.get(language_code, (0, 0))
+        word, low, high = word.encode('utf-8'), 0, size
+        while low < high:
+            middle = (low + high) // 2
+            if self._word(index, middle) < word:
+                low = middle + 1
+            else:
+                high = middle
+        return low < size and self._word(index, low) == word
+
+    def close(self):
+        self._mmap.close()
+
 
 def parse_stopwords(handle):
     """Parse a file with stopwords in it into a list of stopwords.
@@ -37,33 +127,112 @@ def parse_stopwords(handle):
         yield line.strip().lower()
 
 
+def _read_stopwords(language_code):
+    relative_path = os.path.join(__path__, 'data', language_code)
+    try:
+        with open(relative_path, 'r') as handle:
+            return frozenset(parse_stopwords(handle))
+    except OSError:
+        return None
+
+
+def _stopword_table():
+    global STOPWORD_TABLE
+    if STOPWORD_TABLE is None:
+        try:
+            STOPWORD_TABLE = StopwordTable(STOPWORD_TABLE_PATH)
+        except (OSError, ValueError, struct.error):
+            # no usable table, stopwords are read from the text files
+            STOPWORD_TABLE = False
+    return STOPWORD_TABLE
+
+
 def load_stopwords(language_code):
     """Load a stopwordlist from the data directory.
 
     Returns a frozenset with all stopwords or an empty set if
     the language_code was not recognized.
 
+    The compiled stopword table is used if available, otherwise the text
+    file of the language is read.
+
     :param language_code: A ISO-639 Alpha2 language code
     :returns: A frozenset of words.
     """
     global STOPWORD_CACHE
+    if not language_code:
+        return frozenset([])
     if language_code in STOPWORD_CACHE:
         return STOPWORD_CACHE[language_code]
 
-    relative_path = os.path.join(__path__, 'data', language_code)
-    try:
-        with open(relative_path, 'r') as handle:
-            stopwords = frozenset(parse_stopwords(handle))
-            STOPWORD_CACHE[language_code] = stopwords
-            return stopwords
-    except OSError:
+    stopwords = None
+    table = _stopword_table()
+    if table:
+        stopwords = table.words(language_code)
+    if stopwords is None:
+        stopwords = _read_stopwords(language_code)
+    if stopwords is None:
         return frozenset([])
 
+    STOPWORD_CACHE[language_code] = stopwords
+    return stopwords
+
+
+def warmup():
+    """Load the stopwords of all languages into the cache."""
+    for language_code in os.listdir(os.path.join(__path__, 'data')):
+        if '.' not in language_code:
+            load_stopwords(language_code)
+
+
+def compile_stopwords(table_path=STOPWORD_TABLE_PATH):
+    """Compile the stopword text files of all languages into one table.
+
+    The table has to be compiled again after changing a stopword file.
+
+    :param table_path: Path of the table to be written.
+    """
+    languages = []
+    for language_code in sorted(os.listdir(os.path.join(__path__, 'data'))):
+        if '.' not in language_code:
+            words = sorted(
+                word.encode('utf-8')
+                for word in _read_stopwords(language_code)
+            )
+            languages.append((language_code, words))
+
+    # header, language entries, then word offsets and words per language
+    offset = TABLE_HEADER.size + len(languages) * TABLE_ENTRY.size
+    entries, data = [], []
+    for language_code, words in languages:
+        entries.append(TABLE_ENTRY.pack(
+            language_code.encode('ascii'), offset, len(words)
+        ))
+        word_offset = offset + (len(words) + 1) * TABLE_OFFSET.size
+        for word in words:
+            data.append(TABLE_OFFSET.pack(word_offset))
+            word_offset += len(word) + 1
+        data.append(TABLE_OFFSET.pack(word_offset))
+        data.extend(word + b'\n' for word in words)
+        offset = word_offset
+
+    atomic_write(table_path, b''.join(
+        [TABLE_HEADER.pack(TABLE_MAGIC, len(languages))] + entries + data
+    ), mode=0o644)
+
+
+if os.environ.get(WARMUP_ENV):
+    warmup()
+
 
 if __name__ == '__main__':
     import sys
-    import guess_language
+    from hugin.analyze.langid import identify
 
     if '--cli' in sys.argv:
-        code = guess_language.guess_language(sys.argv[2])
+        code = identify(sys.argv[2])
         print(load_stopwords(code))
+
+    if '--compile' in sys.argv:
+        compile_stopwords()
+        print('Compiled stopword table:', STOPWORD_TABLE_PATH)
@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+"""
+Overview
+~~~~~~~~
+
+Precompiled text normalization used by modifiers and postprocessing.
+
+A :class:`TextCleaner` is built of named rules, the patterns of all rules
+are compiled once when the cleaner is created. Cleaning a text applies all
+rules in the order of :data:`RULES`, so the same rule set always gives the
+same result, independent of the order the rules were requested in.
+
+Available rules:
+
+    * *html* -- decode html entities like ``&amp;`` or ``&#39;``
+    * *boilerplate* -- remove provider notes like ``Quelle: ...`` on the
+      last line
+    * *brackets* -- remove bracketed text like actor names
+    * *whitespace* -- collapse whitespace runs and strip the text
+"""
+
+# stdlib
+from functools import lru_cache
+import html
+import re
+
+
+# Rule order, rules are always applied in this order
+RULES = ('html', 'boilerplate', 'brackets', 'whitespace')
+
+# Trailing notes providers append to plots, a note has to start a line
+BOILERPLATE = (
+    r'\(?(?:Quelle|Source)\s*:[^\n()]*\)?',
+    r'(?:Written|Geschrieben)\s+(?:by|von)\s+[^\n]*',
+    r'[-–]\s*(?:Wikipedia|IMDb|TMDb|OFDb|Filmstarts)\b[^\n]*',
+    r'From Wikipedia, the free encyclopedia[^\n]*'
+)
+
+PATTERNS = {
+    'boilerplate': (
+        r'(?:\A|\s*\n)[ \t]*(?:{})\s*\Z'.format('|'.join(BOILERPLATE)), '',
+        re.IGNORECASE
+    ),
+    # the former BracketClean pattern, keeps whitespace after the bracket
+    'brackets': (r'\s+\(.*?\)(\s*)', r'\g<1>', 0),
+    'whitespace': (r'\s+', ' ', 0)
+}
+
+
+class TextCleaner:
+    """
+    Clean texts and movie attributes with a fixed rule set.
+
+    .. autosummary::
+
+        clean
+        clean_attributes
+
+    """
+    def __init__(self, rules=RULES):
+        """
+        :param rules: Names of the rules to apply, a list or a comma or colon
+                      separated string, see :data:`RULES`.
+
+        """
+        rules = set(split_names(rules))
+        unknown = rules.difference(RULES)
+        if unknown:
+            raise ValueError('Unknown rules: {}'.format(sorted(unknown)))
+
+        self.rules = tuple(rule for rule in RULES if rule in rules)
+        self._unescape = 'html' in rules
+        self._substitutions = []
+        for rule in self.rules:
+            if rule in PATTERNS:
+                pattern, replacement, flags = PATTERNS[rule]
+                self._substitutions.append(
+                    (re.compile(pattern, flags).sub, replacement)
+                )
+        self._strip = 'whitespace' in rules
+
+    def clean(self, text):
+        """ Return the cleaned text, values other than str are returned as is.
+        """
+        if not isinstance(text, str):
+            return text
+        if self._unescape and '&' in text:
+            text = html.unescape(text)
+        for sub, replacement in self._substitutions:
+            text = sub(replacement, text)
+        if self._strip:
+            text = text.strip()
+        return text
+
+    def clean_attributes(self, attributes, attr_names):
+        """ Clean the given attributes of a attribute dict in place.
+
+        :param attributes: A attribute name -> value dict.
+        :param attr_names: Names of the attributes to be cleaned.
+        :returns: True if any attribute changed.
+
+        """
+        changed = False
+        for attr_name in attr_names:
+            value = attributes.get(attr_name)
+            if value:
+                cleaned = self.clean(value)
+                if cleaned != value:
+                    attributes[attr_name] = cleaned
+                    changed = True
+        return changed
+
+
+@lru_cache(maxsize=32)
+def _cached_cleaner(rules):
+    return TextCleaner(rules)
+
+
+def get_cleaner(rules=RULES):
+    """ Return a shared, already compiled cleaner for rules. """
+    return _cached_cleaner(tuple(sorted(set(split_names(rules)))))
+
+
+def split_names(names):
+    """ Split a comma or colon separated string of names into a list. """
+    if isinstance(names, str):
+        return [name.strip() for name in re.split('[,:]', names)
+                if name.strip()]
+    return list(names)
+
+
+if __name__ == '__main__':
+    import unittest
+
+    class TestTextCleaner(unittest.TestCase):
+
+        def test_rules(self):
+            cleaner = TextCleaner()
+            self.assertEqual(cleaner.rules, RULES)
+            self.assertEqual(
+                cleaner.clean(
+                    'Marv (Mickey Rourke) lives in  Sin City.\n'
+                    'Tom &amp; Jerry.\n  Quelle: Wikipedia'
+                ), 'Marv lives in Sin City. Tom & Jerry.'
+            )
+            self.assertEqual(
+                cleaner.clean('A heist.\n\nWritten by Anonymous'), 'A heist.'
+            )
+            self.assertEqual(cleaner.clean(None), None)
+            self.assertEqual(cleaner.clean(['a  b']), ['a  b'])
+
+        def test_boilerplate_keeps_plot(self):
+            cleaner = TextCleaner('boilerplate')
+            plots = [
+                'A young woman finds a diary written by her late mother.',
+                'Marv searches for the source: a woman named Goldie.',
+                'A heist - Wikipedia editors hate it.',
+                'Line one.\n\nLine two.'
+            ]
+            for plot in plots:
+                self.assertEqual(cleaner.clean(plot), plot)
+            self.assertEqual(
+                cleaner.clean('A heist.\n\n(Quelle: Wikipedia)\n'), 'A heist.'
+            )
+            self.assertEqual(
+                cleaner.clean('A heist.\n- Wikipedia'), 'A heist.'
+            )
+
+        def test_bracketclean_compatible(self):
+            cleaner = TextCleaner('brackets')
+            self.assertEqual(
+                cleaner.clean('Marv (Mickey Rourke)\n is (not) nice.'),
+                'Marv\n is nice.'
+            )
+            self.assertEqual(cleaner.clean('(Intro) text'), '(Intro) text')
+
+        def test_clean_attributes(self):
+            cleaner = get_cleaner('whitespace:html')
+            self.assertTrue(cleaner is get_cleaner(['html', 'whitespace']))
+            attributes = {'title': ' Sin  City ', 'plot': 'ok', 'year': 2005}
+            self.assertTrue(cleaner.clean_attributes(
+                attributes, ['title', 'plot', 'year', 'genre']
+            ))
+            self.assertEqual(
+                attributes, {'title': 'Sin City', 'plot': 'ok', 'year': 2005}
+            )
+            self.assertFalse(cleaner.clean_attributes(attributes, ['title']))
+
+        def test_unknown_rule(self):
+            self.assertRaises(ValueError, TextCleaner, 'brackets,katze')
+
+    unittest.main()
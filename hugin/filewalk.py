@@ -2,8 +2,18 @@
 # encoding: utf-8
 
 import os
-import glob
+import hashlib
 import xmltodict
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from hugin.utils.fileutil import atomic_write
+
+
+# attributes of unchanged movies in rescan_metadata results
+UNCHANGED = 'unchanged'
+# nfo files removed while rescan_metadata was running
+REMOVED = 'removed'
 
 
 def attr_mapping():
@@ -29,32 +39,303 @@ def attr_import_func(nfo_file, mask):
 
 
 def data_import(path):
-    metadata = []
-    for moviefolder in os.listdir(path):
-        full_movie_path = os.path.join(path, moviefolder)
-        nfofile = glob.glob1(full_movie_path, '*.nfo')
-        if nfofile == []:
-            nfofile = full_movie_path
-        else:
-            nfofile = os.path.join(full_movie_path, nfofile.pop())
-        metadata.append(nfofile)
-    return metadata
+    return list(scan_metadata(path))
+
+
+def scan_metadata(roots):
+    """ Lazily yield the metadata file of every movie folder in roots.
+
+    The last nfo file of a movie folder is its metadata file, folders
+    without nfo file are yielded themselves.
+
+    :param roots: A library path or a list of library paths.
+
+    """
+    for movie_folder, nfofile in _scan_movie_folders(roots):
+        yield nfofile or movie_folder
+
+
+def _scan_movie_folders(roots):
+    if isinstance(roots, str):
+        roots = [roots]
+
+    for root in roots:
+        with os.scandir(root) as movie_folders:
+            for movie_folder in movie_folders:
+                if movie_folder.is_dir():
+                    yield movie_folder.path, _find_nfo(movie_folder.path)
+
+
+def _find_nfo(path):
+    nfofile = None
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.name.endswith('.nfo') and not entry.name.startswith('.'):
+                nfofile = entry.path
+    return nfofile
+
+
+def import_metadata(
+        roots, mask, helper=attr_import_func, workers=8, queue_size=256):
+    """ Scan roots and read the nfo files on a thread pool.
+
+    Scanning and reading are decoupled by a bounded queue, at most
+    queue_size nfo files are pending, results are yielded in scan order.
+
+    :param roots: A library path or a list of library paths.
+    :param mask: Attribute mask passed to helper, see :func:`attr_mapping`.
+    :param helper: Function reading the attributes of a nfo file.
+    :param workers: Number of threads reading nfo files.
+    :param queue_size: Max. number of pending nfo files.
+    :returns: A generator yielding (key, nfo, attributes) tuples, nfo and
+              attributes are None for movie folders without nfo file.
+
+    """
+    metadata = rescan_metadata(roots, mask, {}, helper, workers, queue_size)
+    for key, nfo, _, attributes in metadata:
+        yield key, nfo, attributes
+
+
+def rescan_metadata(
+        roots, mask, manifest, helper=attr_import_func, workers=8,
+        queue_size=256):
+    """ Like :func:`import_metadata`, but only read changed nfo files.
+
+    Every metadata file gets a (mtime, size, digest) stamp. Nfo files with
+    the mtime and size of the manifest stamp are only stat'ed, nfo files
+    with the same content digest are not parsed again. Folders without nfo
+    file are unchanged if they are part of the manifest.
+
+    :param manifest: A metadata file -> stamp mapping of the last scan.
+    :returns: A generator yielding (key, nfo, stamp, attributes) tuples,
+              attributes is :data:`UNCHANGED` for unchanged movies.
+
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for movie_folder, nfofile in _scan_movie_folders(roots):
+            known_stamp = manifest.get(nfofile or movie_folder)
+            future = None
+            if nfofile is not None:
+                future = executor.submit(
+                    _read_changed, nfofile, mask, helper, known_stamp
+                )
+            elif known_stamp is not None:
+                future = _Done((known_stamp, UNCHANGED))
+            pending.append((movie_folder, nfofile, future))
+
+            if len(pending) >= queue_size:
+                yield from _import_result(*pending.popleft())
+
+        while pending:
+            yield from _import_result(*pending.popleft())
+
+
+class _Done:
+    """ A already finished future. """
+
+    def __init__(self, result):
+        self._result = result
+
+    def result(self):
+        return self._result
+
+
+def _read_changed(nfofile, mask, helper, known_stamp):
+    """ Return the stamp and attributes of nfofile, see rescan_metadata. """
+    try:
+        nfo_stat = os.stat(nfofile)
+        mtime, size = nfo_stat.st_mtime, nfo_stat.st_size
+        if known_stamp and tuple(known_stamp[:2]) == (mtime, size):
+            return known_stamp, UNCHANGED
+
+        with open(nfofile, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None, REMOVED
+    stamp = (mtime, size, digest)
+    if known_stamp and known_stamp[2] == digest:
+        return stamp, UNCHANGED
+    return stamp, helper(nfofile, mask)
+
+
+def _import_result(key, nfo, future):
+    """ Yield the scan result of a movie folder, skip removed nfo files. """
+    if future is None:
+        yield key, nfo, (None, None, None), None
+        return
+
+    stamp, attributes = future.result()
+    if attributes is not REMOVED:
+        yield key, nfo, stamp, attributes
 
 
 ##############################################################################
 # -------------------------- export functions --------------------------------
 ##############################################################################
-def attr_export_func(movie):
-    mask = attr_mapping()
-    print(movie.nfo)
-    with open(movie.nfo, 'r') as f:
-        xml = xmltodict.parse(f.read())
-        for key, filekey in mask.items():
-            xml['movie'][filekey] = movie.attributes[key]
-        with open(movie.nfo, 'w') as f:
-            f.write(xmltodict.unparse(xml, pretty=True))
-
-
-def data_export(metadata_dict):
-    for movie in metadata_dict:
-        attr_export_func(movie)
+def attr_export_func(movie, mask=None):
+    """ Write the attributes of movie to its nfo file.
+
+    The nfo file is only written if its content changes. The new content is
+    written to a temporary file first, which then replaces the nfo file, so
+    an interrupted export never leaves a truncated nfo file.
+
+    :param movie: The movie to be exported.
+    :param mask: Attribute mask, defaults to :func:`attr_mapping`.
+    :returns: True if the nfo file was written, False if it is unchanged.
+
+    """
+    written, _ = _export_nfo(movie, mask)
+    return written
+
+
+def _export_nfo(movie, mask):
+    """ Export movie, return if the nfo was written and its new stamp. """
+    mask = mask or attr_mapping()
+    with open(movie.nfo, 'rb') as f:
+        old_content = f.read()
+
+    xml = xmltodict.parse(old_content)
+    for key, filekey in mask.items():
+        xml['movie'][filekey] = movie.attributes[key]
+    content = xmltodict.unparse(xml, pretty=True).encode('utf-8')
+    written = content != old_content
+    if written:
+        atomic_write(movie.nfo, content)
+
+    # the same (mtime, size, digest) stamp rescan_metadata compares
+    nfo_stat = os.stat(movie.nfo)
+    return written, (
+        nfo_stat.st_mtime, nfo_stat.st_size, hashlib.sha1(content).hexdigest()
+    )
+
+
+def data_export(movies, mask=None, workers=8, progress=None, stamps=None):
+    """ Export the attributes of movies to their nfo files on a thread pool.
+
+    Movies without nfo file are skipped.
+
+    :param movies: Iterable of movies to be exported.
+    :param mask: Attribute mask, defaults to :func:`attr_mapping`.
+    :param workers: Number of threads exporting nfo files.
+    :param progress: Called with (number of exported movies, number of
+                     movies) after every exported movie.
+    :param stamps: A dict, filled with a nfo file -> stamp entry for every
+                   written or unchanged nfo file, see
+                   :func:`rescan_metadata`.
+    :returns: A dict with the number of 'written', 'unchanged', 'skipped'
+              and 'failed' movies.
+
+    """
+    movies = list(movies)
+    counts = {'written': 0, 'unchanged': 0, 'skipped': 0, 'failed': 0}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(_export_nfo, movie, mask): movie
+            for movie in movies if movie.nfo
+        }
+        counts['skipped'] = len(movies) - len(futures)
+        for done, future in enumerate(as_completed(futures), 1):
+            try:
+                written, stamp = future.result()
+                counts['written' if written else 'unchanged'] += 1
+                if stamps is not None:
+                    stamps[futures[future].nfo] = stamp
+            except Exception as e:
+                print('Error while exporting', futures[future].nfo, e)
+                counts['failed'] += 1
+            if progress is not None:
+                progress(done, len(futures))
+    return counts
+
+
+if __name__ == '__main__':
+    import unittest
+    import shutil
+    import tempfile
+    from hugin.analyze.movie import Movie
+
+    NFO = '<movie><title>{}</title><year>2005</year></movie>'
+
+    class TestFilewalk(unittest.TestCase):
+
+        def setUp(self):
+            self._roots = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+            for root, name in zip(self._roots * 2, 'abcd'):
+                os.mkdir(os.path.join(root, name))
+                if name != 'd':
+                    with open(os.path.join(root, name, 'movie.nfo'), 'w') as f:
+                        f.write(NFO.format(name))
+            open(os.path.join(self._roots[0], 'nomovie.txt'), 'w').close()
+
+        def test_data_import(self):
+            self.assertEqual(
+                sorted(data_import(self._roots[0])),
+                [os.path.join(self._roots[0], 'a', 'movie.nfo'),
+                 os.path.join(self._roots[0], 'c', 'movie.nfo')]
+            )
+
+        def test_import_metadata(self):
+            mask = {'title': 'title', 'year': 'year'}
+            imported = {
+                os.path.basename(key): (nfo is not None, attributes)
+                for key, nfo, attributes in
+                import_metadata(self._roots, mask, workers=2, queue_size=1)
+            }
+            self.assertEqual(imported, {
+                'a': (True, {'title': 'a', 'year': '2005'}),
+                'b': (True, {'title': 'b', 'year': '2005'}),
+                'c': (True, {'title': 'c', 'year': '2005'}),
+                'd': (False, None)
+            })
+
+        def test_rescan_removed(self):
+            path = os.path.join(self._roots[0], 'a', 'movie.nfo')
+            self.assertEqual(
+                _read_changed(path + '.gone', {}, attr_import_func, None),
+                (None, REMOVED)
+            )
+            self.assertEqual(list(_import_result(
+                'a', path, _Done((None, REMOVED))
+            )), [])
+
+        def test_data_export(self):
+            path = os.path.join(self._roots[0], 'a', 'movie.nfo')
+            mask = {'title': 'title'}
+            movie = Movie(os.path.dirname(path), path, {'title': 'a'})
+            self.assertTrue(attr_export_func(movie, mask))
+            self.assertFalse(attr_export_func(movie, mask))
+
+            movie.attributes['title'] = 'Sin City'
+            nomovie = Movie(self._roots[0], None, {})
+            progress, stamps = [], {}
+            counts = data_export(
+                [movie, nomovie], mask,
+                progress=lambda *args: progress.append(args), stamps=stamps
+            )
+            self.assertEqual(counts, {
+                'written': 1, 'unchanged': 0, 'skipped': 1, 'failed': 0
+            })
+            self.assertEqual(progress, [(1, 1)])
+
+            # exported nfo files are unchanged for the next rescan
+            self.assertEqual(list(stamps), [path])
+            self.assertEqual(
+                _read_changed(path, mask, attr_import_func, stamps[path]),
+                (stamps[path], UNCHANGED)
+            )
+            touched = (0.0,) + stamps[path][1:]
+            _, attributes = _read_changed(
+                path, mask, attr_import_func, touched
+            )
+            self.assertTrue(attributes is UNCHANGED)
+            self.assertEqual(
+                attr_import_func(path, mask), {'title': 'Sin City'}
+            )
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['movie.nfo'])
+
+        def tearDown(self):
+            for root in self._roots:
+                shutil.rmtree(root)
+
+    unittest.main()
@@ -14,4 +14,4 @@ class Json(provider.IConverter):
         self.file_ext = '.json'
 
     def convert(self, result):
-        return json.dumps(result._result_dict, sort_keys=True)
+        return json.dumps(dict(result._result_dict), sort_keys=True)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+""" The job structure passed between session and downloadqueue. """
+
+
+class Job:
+    """
+    A download job for a single provider.
+
+    The job is filled by the session (provider, url, retries_left), the
+    downloadqueue (future, response, return_code, cache_used) and the provider
+    (result, done).
+
+    """
+    __slots__ = (
+        'url', 'future', 'response', 'done', 'result', 'return_code',
+        'retries_left', 'provider', 'cache_used'
+    )
+
+    def __init__(self, provider=None, retries_left=None):
+        self.url = self.future = self.response = None
+        self.done = self.result = self.return_code = None
+        self.cache_used = None
+        self.provider = provider
+        self.retries_left = retries_left
+
+    def __repr__(self):
+        return '<Job {0} : {1}>'.format(self.provider, self.url)
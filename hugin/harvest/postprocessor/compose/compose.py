@@ -4,22 +4,31 @@
 """ Postprocessor module to create a custom result out of found results. """
 
 # stdlib
-from collections import defaultdict
-import difflib
+from collections import defaultdict, Counter
 import math
-import copy
 
 # hugin
 from hugin.harvest.provider.result import Result
+from hugin.utils.stringcompare import clean_movie_title
+from hugin.utils.stringcompare import string_similarity_ratio
 import hugin.harvest.provider as provider
 
 
+# Min. average of title, year and director similarity for equal movies
+SIMILARITY_THRESHOLD = 0.85
+
+# Max. year difference of equal movies, the year similarity of a larger
+# difference is too low to reach the threshold
+YEAR_WINDOW = 2
+
+
 class Compose(provider.IPostprocessor):
     """Create a custom result.
 
     .. autosummary::
 
-        create_custom_result
+        process
+        process_batch
 
     """
 
@@ -33,6 +42,7 @@ class Compose(provider.IPostprocessor):
             'countries', 'genre', 'genre_norm', 'collection', 'studios',
             'trailers', 'actors', 'keywords', 'tagline', 'outline'
         ]
+        self._empty_result_dict = dict.fromkeys(self._keys)
 
     def process(self, results, profile=None, merge_genre=True):
         """
@@ -42,27 +52,69 @@ class Compose(provider.IPostprocessor):
         :param profile: A user defined profile for merging results.
         :returns: A list with custom results.
         """
+        return next(self.process_batch([results], profile, merge_genre))
+
+    def process_batch(self, result_lists, profile=None, merge_genre=True):
+        """
+        Compose the results of many queries at once.
+
+        The profile is compiled once into per attribute provider priority
+        tables, the merged results are yielded as soon as a result list is
+        composed.
+
+        :param result_lists: An iterable with one result list per query.
+        :param profile: A user defined profile for merging results.
+        :returns: A generator yielding a list with custom results per query.
+        """
+        profile_table = None
+        if profile is not None:
+            profile_table = self._compile_profile(profile)
+
+        for results in result_lists:
+            yield self._compose(results, profile_table, merge_genre)
+
+    def _compose(self, results, profile_table, merge_genre):
         custom_results = []
         valid_results = [result for result in results if result.result_dict]
         grouped_results = self._group_by_imdbid(valid_results)
         for results in grouped_results.values():
-            if profile is None:
+            if profile_table is None:
                 new_result = self._merge_results_by_priority(results)
             else:
                 new_result = self._merge_results_by_profile(
-                    results, profile
+                    results, profile_table
                 )
-                if new_result == []:
+                if new_result is None:
                     continue
 
-            normalized_multi_genre = self._create_multi_provider_genre(
-                results, 'genre_norm'
-            )
             if merge_genre:
+                normalized_multi_genre = self._create_multi_provider_genre(
+                    results, 'genre_norm'
+                )
                 new_result._result_dict['genre_norm'] = normalized_multi_genre
             custom_results.append(new_result)
         return custom_results
 
+    def _compile_profile(self, profile):
+        """
+        Compile a merge profile into provider priority tables.
+
+        :param profile: A attribute -> provider names mapping, the 'default'
+                        key lists the providers of the base result.
+        :returns: A (default providers, [(attribute, providers), ...]) tuple
+                  with uppercased provider names.
+
+        """
+        def upper_names(provider_names):
+            return tuple(name.upper() for name in provider_names)
+
+        default = upper_names(profile.get('default', ()))
+        attr_table = [
+            (key, upper_names(provider_names))
+            for key, provider_names in profile.items() if key != 'default'
+        ]
+        return default, attr_table
+
     def _create_multi_provider_genre(self, results, genre_key):
         """
         Merge genres from different provider results where movie is equal.
@@ -88,7 +140,7 @@ class Compose(provider.IPostprocessor):
 
         :returns: A result object with custom provider labeling.
         """
-        result_dict = {key:None for key in self._keys}
+        result_dict = self._empty_result_dict.copy()
         result_dict.update(result.result_dict)
         return Result(
             provider=provider_name,
@@ -133,58 +185,55 @@ class Compose(provider.IPostprocessor):
                     if not value:
                         new_result._result_dict[key] = value or left_result
 
-    def _merge_results_by_profile(self, results, profile):
+    def _merge_results_by_profile(self, results, profile_table):
         """
         Merge results by user given merge profile.
 
+        Every attribute is taken from the first provider of its priority
+        table that has a non empty value, all other attributes are taken
+        from the first available default provider.
+
         :results: A list with results to be merged.
-        :returns: A custom result according to profile user specs.
+        :profile_table: A profile compiled by :func:`_compile_profile`.
+        :returns: A custom result according to profile user specs or None if
+                  no default provider result is available.
 
         """
-        # getting the default result provider
-        for name in profile['default']:
-            result_provider = self._get_result_by_providername(results, name)
-            if result_provider:
-                break
+        default, attr_table = profile_table
+        by_provider = {}
+        for result in results:
+            by_provider.setdefault(result.provider.name.upper(), result)
 
-        if result_provider is None:
-            return []
+        for name in default:
+            result_provider = by_provider.get(name)
+            if result_provider is not None:
+                break
+        else:
+            return None
 
         custom_result = self._create_result_copy(result_provider)
+        custom_dict = custom_result._result_dict
 
         # filling the partial stuff on the default result
-        for key, provider_list in profile.items():
-            if key != 'default':
-                for provider_name in provider_list:
-                    provider_result = self._get_result_by_providername(
-                        results, provider_name
-                    )
-                    if provider_result is None:
-                        break
-                    provider_result = provider_result._result_dict[key]
-
-                    if provider_result:
-                        custom_result._result_dict[key] = provider_result
-                        break
+        for key, provider_names in attr_table:
+            for name in provider_names:
+                provider_result = by_provider.get(name)
+                if provider_result is None:
+                    continue
+                value = provider_result._result_dict.get(key)
+                if value:
+                    custom_dict[key] = value
+                    break
         return custom_result
 
-    def _get_result_by_providername(self, results, provider_name):
-        """
-        Find result with a specific provider name and return it.
-
-        :param results: A list with result objects.
-        :param provider_name: Name of the provider to be search for in results.
-        :returns: Returns provider with given provider_name.
-
-        """
-        for result in results:
-            if provider_name.upper() == result.provider.name.upper():
-                return result
-
     def _group_by_imdbid(self, results):
         """
         Group result list by imdbid.
 
+        Results without imdbid are added to the group of a similar
+        result with imdbid, other results without imdbid are dropped, see
+        :func:`_try_set_imdbid`.
+
         :param results: A list with results to be grouped by imdbid.
         :returns: Grouped results with imdbid as key
 
@@ -201,39 +250,88 @@ class Compose(provider.IPostprocessor):
         return grouped_results
 
     def _try_set_imdbid(self, grouped_results, no_imdbid_results):
-        sanitized_groups = []
-        for imdbid, result_list in grouped_results.items():
-            for id_result in result_list:
-                for noid_result in no_imdbid_results:
-                    if self._movie_similarity(id_result, noid_result):
-                        noid_result._result_dict['imdbid'] = imdbid
-                        sanitized_groups.append(noid_result)
-                        #result_list.pop(result_list.index(noid_result))
-        for movie in sanitized_groups:
-            grouped_results[movie._result_dict['imdbid']].append(movie)
-
-        import pprint
-        pprint.pprint(grouped_results)
+        """
+        Infer the imdbid of results without imdbid from similar results.
+
+        Results with imdbid are indexed by blocking keys, a blocking key is a
+        normalized title word and the release year. Only results sharing a
+        title word within :data:`YEAR_WINDOW` years are compared. The year
+        similarity of other years is too low to reach the threshold, results
+        without a shared title word are considered different movies.
+
+        """
+        blocks = defaultdict(list)
+        id_results = [
+            (imdbid, id_result) for imdbid, result_list in
+            grouped_results.items() for id_result in result_list
+        ]
+        for num, (imdbid, id_result) in enumerate(id_results):
+            for key in self._blocking_keys(id_result, YEAR_WINDOW):
+                blocks[key].append(num)
+
+        for noid_result in no_imdbid_results:
+            shared_keys = Counter()
+            for key in self._blocking_keys(noid_result):
+                shared_keys.update(blocks.get(key, ()))
+            # most shared title words first, the equal movie usually matches
+            # on the first compare
+            candidates = sorted(
+                shared_keys, key=lambda num: (-shared_keys[num], num)
+            )
+            for num in candidates:
+                imdbid, id_result = id_results[num]
+                if self._movie_similarity(id_result, noid_result):
+                    noid_result._result_dict['imdbid'] = imdbid
+                    grouped_results[imdbid].append(noid_result)
+                    break
+
+    def _blocking_keys(self, result, year_window=0):
+        """
+        Return the (title word, year) blocking keys of a result.
+
+        :param year_window: Add keys for years within this distance.
+
+        """
+        year = self._result_year(result)
+        title = clean_movie_title(result._result_dict.get('title'))
+        if year is None or not title:
+            return []
+        return [
+            (word, year + offset) for word in set(title.split())
+            for offset in range(-year_window, year_window + 1)
+        ]
+
+    def _result_year(self, result):
+        try:
+            return int(result._result_dict.get('year')) or None
+        except (TypeError, ValueError):
+            return None
 
     def _movie_similarity(self, r1, r2):
-        titile_sim = self._compare_movie_title(
-            r1._result_dict['title'], r2._result_dict['title']
-        )
         year_sim = self._compare_movie_year(
-            r1._result_dict['year'], r2._result_dict['year']
+            self._result_year(r1), self._result_year(r2)
         )
+        # the average has to reach the threshold, skip the string compares
+        # if it can not be reached anymore
+        if year_sim + 2.0 < 3 * SIMILARITY_THRESHOLD:
+            return False
+
+        title_sim = self._compare_movie_title(
+            r1._result_dict.get('title'), r2._result_dict.get('title')
+        )
+        if year_sim + title_sim + 1.0 < 3 * SIMILARITY_THRESHOLD:
+            return False
+
         director_sim = self._cmp_director_list(
-            r1._result_dict['directors'], r2._result_dict['directors']
+            r1._result_dict.get('directors'), r2._result_dict.get('directors')
         )
-        return ((titile_sim + year_sim + director_sim) / 3) >= 0.85
+        similarity = (title_sim + year_sim + director_sim) / 3
+        return similarity >= SIMILARITY_THRESHOLD
 
     def _cmp_director_list(self, s1, s2):
         if not s1 or not s2:
             return 0.0
 
-        s1 = [' '.join(sorted(s.split())) for s in s1]
-        s2 = [' '.join(sorted(s.split())) for s in s2]
-
         s1, s2 = sorted([s1, s2], key=len)
         sim_sum = 0
 
@@ -241,18 +339,11 @@ class Compose(provider.IPostprocessor):
             sim_sum += max([self.cmp_string(director, other) for other in s1])
         return (sim_sum / len(s2))
 
-
     def cmp_string(self, s1, s2):
-        return difflib.SequenceMatcher(None, s1.upper(), s2.upper()).ratio()
+        return string_similarity_ratio(s1, s2) or 0.0
 
     def _compare_movie_title(self, t1, t2):
-        if t1 and t2:
-            s1, s2 = self._clean_string(t1), self._clean_string(t2)
-            return difflib.SequenceMatcher(None, s1.upper(), s2.upper()).ratio()
-
-    def _clean_string(self, s):
-        sorted_str = sorted(' '.join(s.split(',')).split())
-        return ' '.join([x.strip() for x in sorted_str])
+        return string_similarity_ratio(t1, t2) or 0.0
 
     def _compare_movie_year(self, y1, y2):
         if y1 and y2:
@@ -268,3 +359,104 @@ class Compose(provider.IPostprocessor):
             'profile': dict,
             'merge_genre': bool
         }
+
+
+if __name__ == '__main__':
+    import unittest
+
+    class Provider:
+        def __init__(self, name, priority):
+            self.name, self._priority = name, priority
+
+    def create_result(provider, title, year, imdbid=None, directors=None):
+        result_dict = {
+            'title': title, 'year': year, 'imdbid': imdbid,
+            'directors': directors, 'genre_norm': None
+        }
+        return Result(provider, {'type': 'movie'}, result_dict, 0)
+
+    class TestCompose(unittest.TestCase):
+
+        def setUp(self):
+            self._compose = Compose()
+            self._tmdb = Provider('TMDBMovie', 100)
+            self._ofdb = Provider('OFDBMovie', 90)
+
+        def test_group_by_imdbid(self):
+            results = [
+                create_result(
+                    self._tmdb, 'Sin City', 2005, 'tt0401792',
+                    ['Frank Miller', 'Robert Rodriguez']
+                ),
+                create_result(
+                    self._tmdb, 'Drive', 2011, 'tt0780504',
+                    ['Nicolas Winding Refn']
+                ),
+                create_result(
+                    self._ofdb, 'Sin City', 2005, None,
+                    ['Robert Rodriguez', 'Frank Miller']
+                ),
+                create_result(
+                    self._ofdb, 'Drive', 1997, None, ['Steve Wang']
+                ),
+                create_result(self._ofdb, 'Drive', None, None, None)
+            ]
+            grouped = self._compose._group_by_imdbid(results)
+            self.assertEqual(
+                {imdbid: len(group) for imdbid, group in grouped.items()},
+                {'tt0401792': 2, 'tt0780504': 1}
+            )
+            self.assertEqual(results[2]._result_dict['imdbid'], 'tt0401792')
+            self.assertTrue(results[3]._result_dict['imdbid'] is None)
+
+        def test_movie_similarity(self):
+            a = create_result(self._tmdb, 'Sin City', 2005, 'tt0401792', ['x'])
+            b = create_result(self._ofdb, 'City, Sin', 2006, None, ['x'])
+            c = create_result(self._ofdb, 'Sin City', 2009, None, ['x'])
+            self.assertTrue(self._compose._movie_similarity(a, b))
+            self.assertFalse(self._compose._movie_similarity(a, c))
+
+        def test_process(self):
+            results = [
+                create_result(self._ofdb, 'Sin City', 2005, 'tt0401792'),
+                create_result(self._tmdb, 'Sin City', 2005, 'tt0401792')
+            ]
+            results[1]._result_dict['genre_norm'] = ['Action']
+            composed, = self._compose.process(results)
+            self.assertEqual(composed.provider, 'Compose')
+            self.assertEqual(composed._result_dict['genre_norm'], {'Action'})
+
+        def test_process_batch(self):
+            profile = {
+                'default': ['omdbmovie', 'tmdbmovie'],
+                'plot': ['ofdbmovie', 'tmdbmovie'],
+                'year': ['omdbmovie', 'tmdbmovie']
+            }
+            result_lists = []
+            for imdbid, title in [('tt0401792', 'Sin City'), ('x', 'Alien')]:
+                tmdb = create_result(self._tmdb, title, 2005, imdbid)
+                ofdb = create_result(self._ofdb, title, 2005, imdbid)
+                tmdb._result_dict['plot'] = 'tmdb plot'
+                result_lists.append([tmdb, ofdb])
+            result_lists[1][1]._result_dict['plot'] = 'ofdb plot'
+            result_lists.append([create_result(self._ofdb, 'Drive', 2011)])
+
+            composed = list(self._compose.process_batch(
+                iter(result_lists), profile=profile, merge_genre=False
+            ))
+            self.assertEqual(len(composed), 3)
+            self.assertEqual(
+                [[r._result_dict['plot'] for r in c] for c in composed],
+                [['tmdb plot'], ['ofdb plot'], []]
+            )
+            self.assertEqual(composed[0][0]._result_dict['year'], 2005)
+            single = [
+                self._compose.process(results, profile, merge_genre=False)
+                for results in result_lists
+            ]
+            self.assertEqual(
+                [[r._result_dict for r in c] for c in composed],
+                [[r._result_dict for r in c] for c in single]
+            )
+
+    unittest.main()
@@ -1,28 +1,64 @@
 #!/usr/bin/env python
 # encoding: utf-8
 
-""" Postprocessor module to create a custom result out of found results. """
+""" Postprocessor module to strip whitespace from result attributes. """
 
 # hugin
 import hugin.harvest.provider as provider
-from hugin.harvest.provider.result import Result
+
+
+# result type -> attributes by value layout
+STR_ATTRS = {
+    'movie': (
+        'title', 'original_title', 'plot', 'imdbid', 'rating', 'providerid',
+        'tagline', 'outline'
+    ),
+    'person': (
+        'name', 'birthday', 'placeofbirth', 'imdbid', 'providerid',
+        'deathday', 'popularity', 'biography'
+    )
+}
+LIST_ATTRS = {
+    'movie': (
+        'directors', 'writers', 'countries', 'genre', 'genre_norm',
+        'collection', 'studios', 'keywords'
+    ),
+    'person': ('alternative_names', 'homepage')
+}
+TUPLE_LIST_ATTRS = {
+    'movie': (
+        'fanart', 'crew', 'actors', 'poster', 'trailers', 'alternative_titles'
+    ),
+    'person': ('photo', 'known_for')
+}
 
 
 class Trim(provider.IPostprocessor):
+    """ Strip surrounding whitespace of all string attributes.
+
+    Strings are stripped, empty strings inside lists are removed and empty
+    strings inside tuples are replaced by None. Lists are modified in place,
+    attributes that are already clean are left untouched.
 
+    .. autosummary::
+
+        process
+        process_batch
+        trim_result
+        trim_result_list
+
+    """
     def __init__(self):
-        self._strattrs = set([
-            'title', 'original_title', 'plot', 'imdbid', 'rating',
-            'providerid', 'tagline', 'outline'
-        ])
-        self._listattrs = set([
-            'directors', 'writers', 'countries', 'genre',
-            'genre_norm', 'collection', 'studios', 'keywords'
-        ])
-        self._tuplestrattrs = set([
-            'fanart', 'crew', 'actors', 'poster', 'fanart', 'trailers',
-            'alternative_titles'
-        ])
+        # result type -> [(attribute, trim function), ...]
+        self._trim_table = {}
+        for result_type in STR_ATTRS:
+            self._trim_table[result_type] = (
+                [(attr, self._trim_str) for attr in STR_ATTRS[result_type]] +
+                [(attr, self._trim_str_list)
+                 for attr in LIST_ATTRS[result_type]] +
+                [(attr, self._trim_tuple_list)
+                 for attr in TUPLE_LIST_ATTRS[result_type]]
+            )
 
     def process(self, result):
         if isinstance(result, list):
@@ -30,70 +66,136 @@ class Trim(provider.IPostprocessor):
         else:
             self.trim_result(result)
 
+    def process_batch(self, result_lists):
+        """ Trim the results of many queries.
+
+        :param result_lists: An iterable with result lists.
+        :returns: A generator yielding every trimmed result list.
 
+        """
+        for results in result_lists:
+            self.trim_result_list(results)
+            yield results
 
     def trim_result(self, result):
-        if result._result_dict:
-            if result._result_type == 'movie':
-                self._trim_movie_result(result._result_dict)
-            elif result._result_type == 'person':
-                self._trim_person_result(result._result_dict)
+        result_dict = result._result_dict
+        if result_dict:
+            for attr, trim in self._trim_table.get(result._result_type, ()):
+                value = result_dict.get(attr)
+                if value:
+                    trimmed = trim(value)
+                    if trimmed is not value:
+                        result_dict[attr] = trimmed
 
     def trim_result_list(self, results):
         for result in results:
             self.trim_result(result)
 
-    def _trim_movie_result(self, result_dict):
-        keys = set(result_dict.keys())
-
-        strattrs = keys & self._strattrs
-        for attr in strattrs:
-            if result_dict.get(attr):
-                result_dict[attr] = result_dict[attr].strip()
-
-        listattrs = keys & self._listattrs
-        self._trim_str_list(listattrs, result_dict)
-
-        tuplestrattrs = keys & self._tuplestrattrs
-        self._trim_tuple_str_list(tuplestrattrs, result_dict)
-
-    def _trim_str_list(self, attrs, resultdict):
-        for attr in attrs:
-            if resultdict[attr]:
-                resultdict[attr] = [v.strip() for v in resultdict[attr] if v]
-
-    def _trim_tuple_str_list(self, attrs, resultdict):
-        print('striping tupleattrs', attrs)
-        for attr in attrs:
-            if resultdict[attr]:
-                resultdict[attr] = list(
-                    map(self._tuple_strip, resultdict[attr])
+##############################################################################
+# -------------------------- helper functions --------------------------------
+##############################################################################
+
+    def _is_clean(self, value):
+        """ Check if a str needs no stripping, other values are clean. """
+        return not isinstance(value, str) or (
+            value != '' and not value[0].isspace() and
+            not value[-1].isspace()
+        )
+
+    def _trim_str(self, value):
+        if self._is_clean(value):
+            return value
+        return value.strip()
+
+    def _trim_str_list(self, values):
+        """ Strip all strings of a list and remove empty items. """
+        is_clean = self._is_clean
+        if isinstance(values, list) and all(
+                value and is_clean(value) for value in values):
+            return values
+
+        trimmed = []
+        for value in values:
+            if isinstance(value, str):
+                value = value.strip()
+            if value:
+                trimmed.append(value)
+        if isinstance(values, list):
+            values[:] = trimmed
+            return values
+        return trimmed
+
+    def _trim_tuple_list(self, values):
+        """ Strip all strings of a list of tuples, empty items become None.
+        """
+        if not isinstance(values, list):
+            values = list(values)
+        for num, item in enumerate(values):
+            if isinstance(item, str):
+                values[num] = self._trim_str(item) or None
+            elif isinstance(item, (tuple, list)) and not all(
+                    field is None or (field and self._is_clean(field))
+                    for field in item):
+                values[num] = tuple(
+                    self._trim_str(field) or None for field in item
                 )
+        return values
 
-    def _tuple_strip(self, attrtuple):
-        item_strip = lambda x: x.strip() if x else None
-        return tuple(map(item_strip, attrtuple))
-
-    def _trim_person_result(self, resultdict):
-        pass
 
 if __name__ == '__main__':
-    rdt = Trim()
-    rd = {
-        'title': '    katzen   ',  # str testattr
-        'rating': None,  # str testattr
-        'genre': ['   comedy', 'action   '],  # str list testatter
-        'alternative_titles': ['   comedy', None],  # str list testatter
-        'actors': [
-            ('wolle  ', '  hans peter'), ('jürgen', 'soße'), (None, None)
-        ]
-    }
-    q = {'type': 'movie'}
-    r = Result('prov', q, rd, 8)
-    import pprint
-    print('before')
-    pprint.pprint(r._result_dict)
-    rdt.trim_result(r)
-    print()
-    print('after')
-    pprint.pprint(r._result_dict)
+    import unittest
+    from hugin.harvest.provider.result import Result
+
+    class TestTrim(unittest.TestCase):
+
+        def setUp(self):
+            self._trim = Trim()
+
+        def test_trim_movie(self):
+            actors = [
+                ('wolle  ', '  hans peter'), ('jürgen', 'soße'), (None, '')
+            ]
+            genre = ['   comedy', 'action   ', '', '  ']
+            result = Result('prov', {'type': 'movie'}, {
+                'title': '    katzen   ', 'rating': None, 'genre': genre,
+                'alternative_titles': ['   comedy', None], 'actors': actors,
+                'genre_norm': {' Action'}, 'year': 2005
+            }, 0)
+            clean_actor = actors[1]
+            self._trim.process(result)
+            self.assertEqual(result._result_dict, {
+                'title': 'katzen', 'rating': None,
+                'genre': ['comedy', 'action'],
+                'alternative_titles': ['comedy', None],
+                'actors': [
+                    ('wolle', 'hans peter'), ('jürgen', 'soße'), (None, None)
+                ],
+                'genre_norm': ['Action'], 'year': 2005
+            })
+            self.assertTrue(result._result_dict['genre'] is genre)
+            self.assertTrue(result._result_dict['actors'] is actors)
+            self.assertTrue(actors[1] is clean_actor)
+
+        def test_trim_person(self):
+            result = Result('prov', {'type': 'person'}, {
+                'name': ' Mickey Rourke\n', 'homepage': [None],
+                'known_for': [(' Marv ', 'Sin City')]
+            }, 0)
+            self._trim.process([result])
+            self.assertEqual(result._result_dict, {
+                'name': 'Mickey Rourke', 'homepage': [],
+                'known_for': [('Marv', 'Sin City')]
+            })
+
+        def test_clean_untouched(self):
+            genre = ['Action', 'Drama']
+            result_dict = {'title': 'Sin City', 'genre': genre}
+            result = Result('prov', {'type': 'movie'}, result_dict, 0)
+            results, = self._trim.process_batch([[result]])
+            self.assertEqual(results, [result])
+            self.assertTrue(result_dict['genre'] is genre)
+            self.assertEqual(result_dict, {
+                'title': 'Sin City', 'genre': ['Action', 'Drama']
+            })
+
+    unittest.main()
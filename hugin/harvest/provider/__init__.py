@@ -7,6 +7,8 @@ postprocessor plugins.
 
 from yapsy.IPlugin import IPlugin
 
+from hugin.harvest.provider.result import ResultRecord
+
 __all__ = ['IMovieProvider', 'IPersonProvider', 'IPictureProvider',
            'IConverter', 'IPostprocessor', 'IProvider']
 
@@ -25,19 +27,24 @@ PERSON_ATTR_MASK = [
 ]
 
 
-def movie_result_mask(result):
-    return _result_mask(result, MOVIE_ATTR_MASK)
+class MovieRecord(ResultRecord):
+    """ Compact movie result_dict with a field for every movie attribute. """
+    __slots__ = ()
+    _keys = MOVIE_ATTR_MASK
 
 
-def person_result_mask(result):
-    return _result_mask(result, PERSON_ATTR_MASK)
+class PersonRecord(ResultRecord):
+    """ Compact person result_dict with a field for every person attribute. """
+    __slots__ = ()
+    _keys = PERSON_ATTR_MASK
 
 
-def _result_mask(result, mask):
-    result_mask = {key: None for key in mask}
-    if result:
-        result_mask.update(result)
-    return result_mask
+def movie_result_mask(result):
+    return MovieRecord(result)
+
+
+def person_result_mask(result):
+    return PersonRecord(result)
 
 
 class IProvider(IPlugin):
@@ -287,6 +294,16 @@ class IPostprocessor(IPlugin):
         """
         raise NotImplementedError
 
+    def process_batch(self, result_lists, **kwargs):
+        """ Process the results of many queries, one result list per query.
+
+        :param result_lists: An iterable with result lists.
+        :returns: A generator yielding the processed result of every list.
+
+        """
+        for results in result_lists:
+            yield self.process(results, **kwargs)
+
     def __repr__(self):
         return '{name} <{description}>'.format(
             name=self.name, description=self.description
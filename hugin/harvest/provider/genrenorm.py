@@ -7,6 +7,13 @@ import pkgutil
 import os
 
 
+# Package containing the genrefiles, also valid when run as __main__.
+GENRE_PACKAGE = __package__ or 'hugin.harvest.provider'
+
+# Compiled genre indexes by provider genre file, shared by all instances.
+GENRE_INDEX_CACHE = {}
+
+
 class GenreNormalize:
     """
     Normalize genre according to given provider genre mapping files.
@@ -67,43 +74,52 @@ class GenreNormalize:
         :param provider_genre_file: Filename of provider genere mapping file.
 
         """
-        self._global_genre_map = []
-        self._provider_genre_map = {}
-        self._init_mapping(provider_genre_file)
+        self._genre_index = self._init_mapping(provider_genre_file)
 
     def _init_mapping(self, provider_genre_file):
-        """ Initializes mapping structures. """
+        """
+        Return the compiled genre index for the given provider genre file.
+
+        The index is built once per genre file and shared between all
+        GenreNormalize instances.
+
+        """
+        genre_index = GENRE_INDEX_CACHE.get(provider_genre_file)
+        if genre_index is not None:
+            return genre_index
+
         try:
             # read the genrefiles inside packages
             global_genre_bytes = pkgutil.get_data(
-                __package__, os.path.join('genrefiles', 'normalized_genre.dat')
+                GENRE_PACKAGE, os.path.join('genrefiles', 'normalized_genre.dat')
             )
             provider_genre_bytes = pkgutil.get_data(
-                __package__, os.path.join('genrefiles', provider_genre_file)
+                GENRE_PACKAGE, os.path.join('genrefiles', provider_genre_file)
             )
 
             # create the mapping according given genre files
-            self._global_genre_map = self._create_global_genre_map(
+            global_genre_map = self._create_global_genre_map(
                 global_genre_bytes.decode('utf-8')
             )
-            self._provider_genre_map = self._create_provider_genre_map(
+            provider_genre_map = self._create_provider_genre_map(
                 provider_genre_bytes.decode('utf-8')
             )
         except (UnicodeError, OSError) as e:
             print('Error while reading genrenormalization files.', e)
+            return {}
+
+        genre_index = self._create_genre_index(
+            global_genre_map, provider_genre_map
+        )
+        GENRE_INDEX_CACHE[provider_genre_file] = genre_index
+        return genre_index
 
     def _print_mapping(self, provider_genre_file):
         """ Print current mapping - for test purposes only. """
         print(provider_genre_file)
-        for idx_genre in self._provider_genre_map:
-            idx, genres = idx_genre
-            for genre in genres:
-                print('Provider: {0} --> global DE: {1}.'.format(
-                    genre, self.normalize_genre(genre, 'de'))
-                )
-                print('Provider: {0} --> global EN: {1}.'.format(
-                    genre, self.normalize_genre(genre, 'en'))
-                )
+        for genre, (de, en) in sorted(self._genre_index.items()):
+            print('Provider: {0} --> global DE: {1}.'.format(genre, de))
+            print('Provider: {0} --> global EN: {1}.'.format(genre, en))
         print()
 
     def _strip_genre_list(self, genre_list):
@@ -115,19 +131,19 @@ class GenreNormalize:
         Create a global genre mapping.
 
         Genre mapping is created out of genres listened in
-        normalized_genre.dat. Genre map is a list of tuples containing the
-        genre
+        normalized_genre.dat. Genre map is a dict mapping the genre index to
+        a tuple containing the
 
-            (index, german genre name, english genre name)
+            (german genre name, english genre name)
 
         :param genre_filerepr: A string representing the genre file
-        :returns: A list containing genre index, de, en tuple.
+        :returns: A dict containing index -> (de, en) items.
 
         """
-        genre_map = []
+        genre_map = {}
         for line in genre_filerepr.splitlines():
             num, de, en = self._strip_genre_list(line.split(','))
-            genre_map.append((num, de, en))
+            genre_map[int(num)] = (de, en)
         return genre_map
 
     def _create_provider_genre_map(self, genre_filerepr):
@@ -141,9 +157,28 @@ class GenreNormalize:
         for line in genre_filerepr.splitlines():
             idx, *genres = line.split(',')
             clean_genres = list(set(self._strip_genre_list(genres)))
-            genre_map.append((idx, clean_genres))
+            genre_map.append((int(idx), clean_genres))
         return genre_map
 
+    def _create_genre_index(self, global_genre_map, provider_genre_map):
+        """
+        Compile global and provider mapping into a single lookup table.
+
+        The index maps a case folded provider genre to its normalized
+        (de, en) tuple. If a provider genre is listed more than once the first
+        occurrence wins, like the former linear lookup did.
+
+        :returns: A dict with provider genre -> (de, en) items.
+
+        """
+        genre_index = {}
+        for idx, provider_genre_list in provider_genre_map:
+            for provider_genre in provider_genre_list:
+                genre_index.setdefault(
+                    provider_genre.casefold(), global_genre_map[idx]
+                )
+        return genre_index
+
     def normalize_genre(self, genre, output_lang='de'):
         """
         Normalize a given provider genre to global genre.
@@ -154,14 +189,10 @@ class GenreNormalize:
         :returns: Normalized genre string.
 
         """
-        for idx, provider_genre_list in self._provider_genre_map:
-            for provider_genre in provider_genre_list:
-                if genre.strip().upper() == provider_genre.upper():
-                    idx, de, en = self._global_genre_map[int(idx)]
-                    if output_lang == 'de':
-                        return de.strip()
-                    else:
-                        return en.strip()
+        normalized = self._genre_index.get(genre.strip().casefold())
+        if normalized is not None:
+            de, en = normalized
+            return de if output_lang == 'de' else en
 
     def normalize_genre_list(self, genre_list, output_lang='de'):
         """ A list wrapper for :func:`normalize_genre`. """
@@ -172,3 +203,36 @@ class GenreNormalize:
                 if normalized_genre is not None:
                     normalized.append(normalized_genre)
             return normalized
+
+
+if __name__ == '__main__':
+    import unittest
+
+    class TestGenreNormalize(unittest.TestCase):
+
+        def setUp(self):
+            self._genrenorm = GenreNormalize('omdb.genre')
+
+        def test_normalize_genre(self):
+            self.assertEqual(
+                self._genrenorm.normalize_genre('Adventure'), 'Abenteuer'
+            )
+            self.assertEqual(
+                self._genrenorm.normalize_genre('  adventure ', 'en'),
+                'Adventure'
+            )
+            self.assertTrue(self._genrenorm.normalize_genre('Katze') is None)
+
+        def test_normalize_genre_list(self):
+            self.assertEqual(
+                self._genrenorm.normalize_genre_list(
+                    ['Drama', 'Katze', 'FAMILY'], 'en'
+                ),
+                ['Drama', 'Family']
+            )
+
+        def test_shared_index(self):
+            other = GenreNormalize('omdb.genre')
+            self.assertTrue(other._genre_index is self._genrenorm._genre_index)
+
+    unittest.main()
@@ -86,7 +86,8 @@ class OFDBMovie(provider.IMovieProvider):
                         ratio,
                         string_similarity_ratio(
                             response[title_key],
-                            search_params.title
+                            search_params.title,
+                            min_ratio=ratio
                         )
                     )
                 similarity_map.append(
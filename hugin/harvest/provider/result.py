@@ -3,6 +3,98 @@
 
 """ Represens a finished result that hugin understands. """
 
+# stdlib
+from collections.abc import MutableMapping
+
+
+# Marks a attribute that has been deleted from a ResultRecord
+_DELETED = object()
+
+
+class ResultRecord(MutableMapping):
+    """
+    A compact, dict like container for a provider result.
+
+    All attributes defined by the subclass attribute mask are stored in a
+    fixed field layout instead of a hash table, attributes not filled in by
+    the provider are None. Keys outside of the mask are kept in a small
+    extra dict that is only created on demand.
+
+    """
+    __slots__ = ('_values', '_extra')
+
+    # attribute mask, set by subclasses
+    _keys = ()
+    # key -> field position, derived from the mask
+    _positions = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._keys = tuple(cls._keys)
+        cls._positions = {key: pos for pos, key in enumerate(cls._keys)}
+
+    def __init__(self, result=None):
+        self._values = [None] * len(self._keys)
+        self._extra = None
+        if result:
+            self.update(result)
+
+    def __getitem__(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            if self._extra is None:
+                raise KeyError(key)
+            return self._extra[key]
+
+        value = self._values[position]
+        if value is _DELETED:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key, value):
+        position = self._positions.get(key)
+        if position is None:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+        else:
+            self._values[position] = value
+
+    def __delitem__(self, key):
+        position = self._positions.get(key)
+        if position is None:
+            if self._extra is None:
+                raise KeyError(key)
+            del self._extra[key]
+        elif self._values[position] is _DELETED:
+            raise KeyError(key)
+        else:
+            self._values[position] = _DELETED
+
+    def __iter__(self):
+        for key, value in zip(self._keys, self._values):
+            if value is not _DELETED:
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self):
+        length = len(self._values) - self._values.count(_DELETED)
+        return length + len(self._extra or ())
+
+    def __getstate__(self):
+        return dict(self)
+
+    def __setstate__(self, state):
+        self.__init__()
+        for key in self._keys:
+            if key not in state:
+                self._values[self._positions[key]] = _DELETED
+        self.update(state)
+
+    def __repr__(self):
+        return repr(dict(self))
+
 
 class Result:
     """
@@ -16,6 +108,10 @@ class Result:
         * result type, according to type in query params
 
     """
+    __slots__ = (
+        '_provider', '_search_params', '_result_type', '_retries',
+        '_result_dict', '_clean_titles'
+    )
 
     def __init__(self, provider, query, result, retries):
         """
@@ -32,6 +128,8 @@ class Result:
         self._result_type = self._search_params['type']
         self._retries = retries
         self._result_dict = result
+        # normalized titles, cached by hugin.harvest.ranking
+        self._clean_titles = None
 
     @property
     def provider(self):
@@ -70,3 +168,47 @@ class Result:
             return '<{0} : {1}>'.format(
                 self._provider, 'No item found.'
             )
+
+
+if __name__ == '__main__':
+    import unittest
+    import pickle
+
+    class TestResultRecord(unittest.TestCase):
+
+        class Record(ResultRecord):
+            __slots__ = ()
+            _keys = ['title', 'year', 'plot']
+
+        def setUp(self):
+            self._record = self.Record({'title': 'Sin City', 'extra': 42})
+
+        def test_mapping(self):
+            self.assertEqual(dict(self._record), {
+                'title': 'Sin City', 'year': None, 'plot': None, 'extra': 42
+            })
+            self.assertTrue(self._record['year'] is None)
+            self.assertTrue(self._record.get('katze') is None)
+            with self.assertRaises(KeyError):
+                self._record['katze']
+
+        def test_delete(self):
+            del self._record['plot']
+            del self._record['extra']
+            self.assertEqual(list(self._record), ['title', 'year'])
+            self.assertEqual(len(self._record), 2)
+            with self.assertRaises(KeyError):
+                del self._record['plot']
+
+        def test_pickle(self):
+            del self._record['plot']
+            record = pickle.loads(pickle.dumps(self._record))
+            self.assertEqual(record, self._record)
+            self.assertTrue('plot' not in record)
+
+        def test_no_instance_dict(self):
+            result = Result('prov', {'type': 'movie'}, self._record, 0)
+            self.assertFalse(hasattr(self._record, '__dict__'))
+            self.assertFalse(hasattr(result, '__dict__'))
+
+    unittest.main()
@@ -72,7 +72,8 @@ class TMDBMovie(provider.IMovieProvider, provider.IMoviePictureProvider):
                         ratio,
                         string_similarity_ratio(
                             result[title_key],
-                            search_params.title
+                            search_params.title,
+                            min_ratio=ratio
                         )
                     )
                 similarity_map.append({'tmdbid': result['id'], 'ratio': ratio})
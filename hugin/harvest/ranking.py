@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+""" Rank results by their similarity to the search params of a query. """
+
+# stdlib
+import math
+
+# hugin
+from hugin.utils.stringcompare import clean_movie_title
+from hugin.utils.stringcompare import clean_similarity_ratios
+
+
+def sort_by_ratio(results, query):
+    """
+    Sort results by ratio between result and search params.
+
+    The query title is normalized once, the normalized result titles are
+    cached on the result objects and all titles are scored in a single batch
+    call. Results without a result_dict are dropped.
+
+    :param results: A list with result objects.
+    :param query: The query that belongs to the results given.
+    :returns: A new list with results, best matching result first.
+
+    """
+    results = [result for result in results if result._result_dict]
+    ratios = _rate_results(results, query)
+    ranked = sorted(
+        zip(ratios, results), key=lambda entry: entry[0], reverse=True
+    )
+    return [result for ratio, result in ranked]
+
+
+def _rate_results(results, query):
+    """ Return a list with a ratio for every result in results. """
+    ratios = [0.0] * len(results)
+    qry_imdb, qry_title = query.get('imdbid'), query.get('title')
+
+    title_slots, clean_titles = [], []
+    for num, result in enumerate(results):
+        if qry_imdb and qry_imdb == result._result_dict.get('imdbid'):
+            ratios[num] = 1.0
+        elif qry_title:
+            for clean_title in _clean_result_titles(result):
+                if clean_title is not None:
+                    title_slots.append(num)
+                    clean_titles.append(clean_title)
+
+    if clean_titles:
+        title_ratios = clean_similarity_ratios(
+            clean_movie_title(qry_title), clean_titles
+        )
+        for num, ratio in zip(title_slots, title_ratios):
+            ratios[num] = max(ratios[num], ratio)
+
+        qry_year = query.get('year')
+        for num in set(title_slots):
+            result_year = results[num]._result_dict['year']
+            if qry_year and result_year:
+                ratios[num] *= year_penalty(qry_year, result_year)
+    return ratios
+
+
+def _clean_result_titles(result):
+    """
+    Return the normalized (original_title, title) of a result.
+
+    The normalized titles are cached on the result and only recomputed if the
+    titles inside the result_dict have changed in the meantime. Empty titles
+    are normalized to None.
+
+    """
+    titles = (
+        result._result_dict.get('original_title'),
+        result._result_dict['title']
+    )
+    if result._clean_titles is None or result._clean_titles[0] != titles:
+        clean_titles = tuple(
+            clean_movie_title(title) if title else None for title in titles
+        )
+        result._clean_titles = (titles, clean_titles)
+    return result._clean_titles[1]
+
+
+def year_penalty(year_a, year_b):
+    """ Return a factor <= 1.0 that grows with the year difference. """
+    return math.sqrt(1 - (abs(year_a - year_b) / max(year_a, year_b)))
+
+
+if __name__ == '__main__':
+    import unittest
+    import random
+    from hugin.harvest.query import Query
+    from hugin.harvest.provider.result import Result
+    from hugin.utils.stringcompare import string_similarity_ratio
+
+    def reference_sort_by_ratio(results, query):
+        """ The former Session._sort_by_ratio, used as reference. """
+        ratio_table = []
+        qry_imdb = query.get('imdbid')
+        for result in filter(lambda res: res._result_dict, results):
+            ratio = 0.0
+            if qry_imdb and qry_imdb == result._result_dict.get('imdbid'):
+                ratio = 1.0
+            elif query.get('title'):
+                ratio_a = string_similarity_ratio(
+                    query.title, result._result_dict.get('original_title')
+                )
+                ratio_b = string_similarity_ratio(
+                    query.title, result._result_dict['title']
+                )
+                ratio = max(ratio_a or 0.0, ratio_b or 0.0)
+                if query.get('year') and result._result_dict['year']:
+                    a, b = query.get('year'), result._result_dict['year']
+                    penalty = math.sqrt(1 - (abs(a - b) / max(a, b)))
+                    ratio *= penalty
+            ratio_table.append({'result': result, 'ratio': ratio})
+        ratio_table.sort(key=lambda x: x['ratio'], reverse=True)
+        return [res['result'] for res in ratio_table]
+
+    class TestRanking(unittest.TestCase):
+
+        def setUp(self):
+            titles = [
+                'Sin City', 'City, Sin', 'Sin City 2', 'Sin', None, '',
+                'Sin City: A Dame to Kill For', 'Drive', 'Sun Sity',
+                'Only God Forgives', 'Sin City'
+            ]
+            years = [2005, 2014, None, 1999, 2005]
+            random.seed(42)
+            self._results = []
+            for num in range(200):
+                result_dict = {
+                    'title': random.choice(titles),
+                    'original_title': random.choice(titles),
+                    'year': random.choice(years),
+                    'imdbid': random.choice(['tt0401792', 'tt0780504', None])
+                }
+                if num % 17 == 0:
+                    result_dict = {}
+                query = Query({'title': 'Sin City'})
+                self._results.append(Result(
+                    provider='prov{}'.format(num),
+                    query=query, result=result_dict, retries=0
+                ))
+
+        def assert_same_ranking(self, query):
+            expected = reference_sort_by_ratio(self._results, query)
+            self.assertEqual(sort_by_ratio(self._results, query), expected)
+
+        def test_title_ranking(self):
+            self.assert_same_ranking(Query({'title': 'Sin City'}))
+
+        def test_title_year_ranking(self):
+            self.assert_same_ranking(Query({'title': 'sin city', 'year': 2005}))
+
+        def test_imdbid_ranking(self):
+            self.assert_same_ranking(
+                Query({'title': 'Sun Sity', 'imdbid': 'tt0401792'})
+            )
+            self.assert_same_ranking(Query({'imdbid': 'tt0780504'}))
+
+        def test_cached_titles(self):
+            query = Query({'title': 'Drive'})
+            self.assert_same_ranking(query)
+            for result in self._results:
+                if result._result_dict:
+                    result._result_dict['title'] = 'Drive'
+            self.assert_same_ranking(query)
+
+    unittest.main()
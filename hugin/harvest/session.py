@@ -10,30 +10,38 @@ from collections import OrderedDict
 from itertools import zip_longest
 from functools import reduce
 from operator import add
-import math
-import types
+from urllib.parse import quote_plus, urlsplit
 import signal
 import queue
 import copy
-import requests
 import re
 import uuid
+import os
 
 # hugin
-from hugin.utils.stringcompare import string_similarity_ratio
 from hugin.harvest.pluginhandler import PluginHandler
 from hugin.harvest.downloadqueue import DownloadQueue
+from hugin.harvest.job import Job
 from hugin.harvest.provider.result import Result
 from hugin.harvest.provider import movie_result_mask, person_result_mask
 from hugin.harvest.cache import Cache
 from hugin.harvest.query import Query
+from hugin.harvest.ranking import sort_by_ratio
+from hugin.harvest.titleindex import TitleIndex
+
+
+# The title index outlives the per session default cache
+TITLE_INDEX_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'hugin')
+IMDB_TITLE_URL = re.compile(r'http://www\.imdb\.com/title/(tt\d+)')
+IMDB_TITLE = re.compile(r'\>(.+?)\s*\((\d{4})')
 
 
 class Session:
 
     def __init__(
         self, cache_path=None, parallel_jobs=1, parallel_downloads_per_job=8,
-        timeout_sec=5, user_agent='libhugin/1.0'
+        timeout_sec=5, user_agent='libhugin/1.0', title_index_path=None,
+        remote_lookup=True
     ):
         """
         Init a session object with user specified parameters.
@@ -91,12 +99,26 @@ class Session:
 
         :param str user_agent: User-agent to be used for metadata downloading.
 
+        :param str title_index_path: Path of the local title index.
+
+        The title index is used by fuzzy search and imdbid title lookups. It is
+        filled with every harvested movie and with the movies found in the
+        cache, it defaults to *~/.cache/hugin/*.
+
+        :param bool remote_lookup: Allow google/imdb lookups.
+
+        If set, fuzzy search and imdbid title lookups fall back to a remote
+        lookup for titles not found in the local title index.
+
         """
         signal.signal(signal.SIGINT, self._signal_handler)
 
         if cache_path is None:
             cache_path = '/tmp/{uuid}'.format(uuid=str(uuid.uuid4()))
 
+        if title_index_path is None:
+            title_index_path = TITLE_INDEX_PATH
+
         self._config = {
             'cache_path': cache_path,
             # limit parallel jobs to 4, there is no reason for a huge number of
@@ -105,6 +127,8 @@ class Session:
             'download_threads': parallel_downloads_per_job,
             'timeout_sec': timeout_sec,
             'user_agent': user_agent,
+            'title_index_path': title_index_path,
+            'remote_lookup': remote_lookup
         }
 
         self._plugin_handler = PluginHandler()
@@ -141,6 +165,13 @@ class Session:
         for provider in self._provider:
             self._categorize(provider)
 
+        self._title_index = TitleIndex()
+        self._title_index.open(path=self._config['title_index_path'])
+        self._movie_provider_by_host = self._map_movie_provider_by_host()
+        self._title_index.update_from_cache(
+            self._cache, self._parse_cached_response
+        )
+
     def create_query(self, **kwargs):
         """
         Validate params and return a Query.
@@ -406,6 +437,12 @@ class Session:
         are returned. The fuzzy search will even work if you misspell the title
         like 'unly gut forgivs'.
 
+        The imdbid is looked up in a local title index first. The index
+        contains all movies harvested before and all movies found in the cache.
+        Only if the title is not found there and remote lookups are enabled, a
+        remote lookup is done through the download queue, using the cache and
+        the configured timeout.
+
         Example:
 
         .. code-block:: python
@@ -448,12 +485,6 @@ class Session:
         else:
             query.cache = None
 
-        if query['fuzzysearch']:
-            self._fuzzy_search(query)
-
-        if query['type'] == 'movie' and query['id_title_lookup']:
-            self._imdbid_title_lookup(query)
-
         downloadqueue = DownloadQueue(
             num_threads=self._config['download_threads'],
             timeout_sec=self._config['timeout_sec'],
@@ -461,6 +492,13 @@ class Session:
             local_cache=query.cache
         )
         self._downloadqueues.append(downloadqueue)
+
+        if query['fuzzysearch']:
+            self._fuzzy_search(query, downloadqueue)
+
+        if query['type'] == 'movie' and query['id_title_lookup']:
+            self._imdbid_title_lookup(query, downloadqueue)
+
         return downloadqueue
 
     def _add_to_cache(self, response):
@@ -496,6 +534,8 @@ class Session:
 
             if job.result:
                 self._add_to_cache(response)
+                if query['type'] == 'movie' and job.done:
+                    self._title_index.add(movie_result_mask(job.result))
 
             if job.done:
                 results.append(self._job_to_result(job, query))
@@ -504,6 +544,7 @@ class Session:
                     job, downloadqueue, query, results
                 )
         downloadqueue.push(None)
+        self._title_index.sync()
 
         if query.remove_invalid:
             results = [result for result in results if result._result_dict.get('title')]
@@ -573,31 +614,115 @@ class Session:
             else:
                 downloadqueue.push(job)
 
-    def _fuzzy_search(self, query):
+    def _fuzzy_search(self, query, downloadqueue):
+        """ Guess a imdbid for the query title, locally or remote. """
         if query['title'] and query['imdbid'] is None:
-            year=query.get('year', '')
-            if year:
-                fmt = 'http://www.google.com/search?hl=de&q={title}+{year} imdb+movie&btnI=745'
-                url = requests.get(fmt.format(title=query['title'], year=query.get('year', ''))).url
-            else:
-                fmt = "http://www.google.com/search?hl=de&q={title} imdb+movie&btnI=745"
-                url = requests.get(fmt.format(title=query['title'])).url
-            imdbids = re.findall('\/tt\d*/', url)
+            imdbid = self._title_index.lookup(query['title'], query['year'])
+            if imdbid is None and self._config['remote_lookup']:
+                imdbid = self._remote_imdbid_lookup(query, downloadqueue)
+            if imdbid:
+                query['imdbid'] = imdbid
+
+    def _remote_imdbid_lookup(self, query, downloadqueue):
+        """ Guess a imdbid by a google 'feeling lucky' search. """
+        fmt = 'http://www.google.com/search?hl=de&q={title}+{year}+imdb+movie'
+        fmt += '&btnI=745'
+        url = fmt.format(
+            title=quote_plus(query['title']), year=query['year'] or ''
+        )
+        job = self._fetch_lookup_url(url, query, downloadqueue)
+        # the redirection target is the imdb page we are looking for
+        for header, (url, content) in zip(job.return_code, job.response):
+            location = ''
+            if isinstance(header, dict):
+                location = header.get('content-location', '')
+            imdbids = re.findall(r'\/(tt\d+)\/', location or content or '')
             if imdbids:
-                query['imdbid'] = imdbids.pop().strip('/')
+                return imdbids[0]
 
-    def _imdbid_title_lookup(self, query):
+    def _imdbid_title_lookup(self, query, downloadqueue):
+        """ Set title and year of the query imdbid, locally or remote. """
         if query['imdbid']:
-            fmt = 'http://www.imdb.com/title/{imdb_id}'
-            url = requests.get(fmt.format(imdb_id=query['imdbid']))
-            if not 'google' in url.url:
-                title, year = re.search(
-                    '\>(.+?)\s*\((\d{4})', url.text
-                ).groups()
-                if year.isnumeric():
-                    query['title'], query['year'] = title, int(year)
-                else:
-                    query['title'], query['year'] = title, None
+            title_year = self._title_index.title(query['imdbid'])
+            if title_year is None and self._config['remote_lookup']:
+                title_year = self._remote_title_lookup(query, downloadqueue)
+            if title_year is not None:
+                query['title'], query['year'] = title_year
+
+    def _remote_title_lookup(self, query, downloadqueue):
+        """ Return a (title, year) tuple scraped from the imdb page. """
+        fmt = 'http://www.imdb.com/title/{imdb_id}'
+        job = self._fetch_lookup_url(
+            fmt.format(imdb_id=query['imdbid']), query, downloadqueue
+        )
+        for url, content in job.response:
+            title_year = self._parse_imdb_title(content)
+            if title_year is not None:
+                self._add_to_cache(job.response)
+                return title_year
+
+    def _parse_imdb_title(self, content):
+        """ Return a (title, year) tuple of a imdb page or None. """
+        match = IMDB_TITLE.search(content or '')
+        if match:
+            title, year = match.groups()
+            return title, int(year) if year.isnumeric() else None
+
+    def _map_movie_provider_by_host(self):
+        """ Return a host -> movie provider dict to assign cached urls. """
+        query = Query({'title': 'hugin', 'imdbid': 'tt0000000'})
+        providers = {}
+        for provider_type in ['movie', 'movie_picture']:
+            for provider in self._provider_types[provider_type]:
+                for url in provider['name'].build_url(query) or []:
+                    providers[urlsplit(url).netloc] = provider['name']
+        return providers
+
+    def _parse_cached_response(self, url, response):
+        """ Return a movie result_dict of a cached response or None.
+
+        Cached imdb pages are parsed like a remote title lookup, other
+        responses are parsed by the movie provider they were requested by.
+
+        """
+        match = IMDB_TITLE_URL.match(url)
+        if match:
+            title_year = self._parse_imdb_title(response)
+            if title_year is not None:
+                title, year = title_year
+                return {'imdbid': match.group(1), 'title': title, 'year': year}
+            return None
+
+        provider = self._movie_provider_by_host.get(urlsplit(url).netloc)
+        if provider is not None:
+            query = Query({'title': 'hugin'})
+            try:
+                result, done = provider.parse_response(
+                    [(url, response)], query
+                )
+            except (KeyError, TypeError, ValueError, AttributeError):
+                # not a movie response, e.g. a person or a search response
+                return None
+            if done and isinstance(result, dict):
+                return result
+
+    def _fetch_lookup_url(self, url, query, downloadqueue):
+        """ Fetch a single url through the downloadqueue, blocks until done.
+
+        :returns: A job with response and return_code filled in.
+
+        """
+        job = self._get_job_struct(provider=None, query=query)
+        job.url = [url]
+        downloadqueue.push(job)
+        if job.future is not None:
+            # pop() raises Empty while the worker hands the finished job over
+            # to the result queue, so wait for the download itself first
+            job.future.result()
+            job = downloadqueue.pop()
+        job.response = job.response or []
+        job.return_code = job.return_code or []
+        return job
 
     def _select_results_by_strategy(self, results, query):
         """
@@ -645,33 +770,7 @@ class Session:
 
     def _sort_by_ratio(self, results, query):
         """ Sort results by ratio between result and search params. """
-        ratio_table = []
-        qry_imdb = query.get('imdbid')
-        for result in filter(lambda res: res._result_dict, results):
-            ratio = 0.0
-            if qry_imdb and qry_imdb == result._result_dict.get('imdbid'):
-                ratio = 1.0
-            elif query.get('title'):
-                ratio_a = string_similarity_ratio(
-                    query.title, result._result_dict.get('original_title')
-                )
-                ratio_b = string_similarity_ratio(
-                    query.title, result._result_dict['title']
-                )
-                ratio = max(ratio_a or 0.0, ratio_b or 0.0)
-
-                # TODO: Fix first time wrong results. Maybe sort by year?
-                if query.get('year') and result._result_dict['year']:
-                    a, b = query.get('year'), result._result_dict['year']
-
-                    penalty = math.sqrt(1 - (abs(a - b) / max(a, b)))
-                    ratio *= penalty
-
-            ratio_entry = {'result': result, 'ratio': ratio}
-            ratio_table.append(ratio_entry)
-
-        ratio_table.sort(key=lambda x: x['ratio'], reverse=True)
-        return [res['result'] for res in ratio_table]
+        return sort_by_ratio(results, query)
 
     def _job_to_result(self, job, query):
         """ Return a result generated from finished job and query. """
@@ -701,13 +800,7 @@ class Session:
 
     def _get_job_struct(self, provider, query):
         """ Return a job structure. """
-        params = [
-            'url', 'future', 'response', 'done', 'result', 'return_code',
-            'retries_left', 'provider'
-        ]
-        job = types.SimpleNamespace(**{param: None for param in params})
-        job.provider, job.retries_left = provider, query.retries
-        return job
+        return Job(provider=provider, retries_left=query.retries)
 
     def _get_matching_provider(self, query):
         """ Return provider list with according to params in query. """
@@ -807,6 +900,7 @@ class Session:
             self._async_executor.shutdown(wait=True)
             # print('closing cache.')
             self._cache.close()
+            self._title_index.close()
             # print('cache closed.')
 
     def cancel(self):
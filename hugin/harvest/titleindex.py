@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+""" A local fuzzy title -> imdbid index of previously harvested movies. """
+
+# stdlib
+from collections import Counter, defaultdict
+from threading import Lock
+import pickle
+import time
+import os
+
+# hugin
+from hugin.utils.fileutil import atomic_write
+from hugin.utils.stringcompare import clean_movie_title
+from hugin.utils.stringcompare import clean_similarity_ratios
+from hugin.harvest.ranking import year_penalty
+
+
+class TitleIndex:
+    """
+    Trigram index for misspelled title -> imdbid lookups without network.
+
+    Every movie result with a imdbid that is added to the index is stored
+    with its title, original title, alternative titles and year. Titles are
+    normalized like :func:`hugin.utils.stringcompare.clean_movie_title` and
+    split into character trigrams. A lookup only compares the query title
+    with titles sharing the most trigrams.
+
+    .. autosummary::
+
+        open
+        add
+        update_from_cache
+        lookup
+        title
+        sync
+        close
+
+    """
+    def __init__(self, max_candidates=50, min_ratio=0.6, sync_interval=60):
+        """
+        :param max_candidates: Number of titles compared on lookup.
+        :param min_ratio: Minimal similarity ratio for a lookup match.
+        :param sync_interval: Min. seconds between two writes by :func:`sync`.
+
+        """
+        self._path = None
+        self._lock = Lock()
+        self._max_candidates = max_candidates
+        self._min_ratio = min_ratio
+        self._sync_interval = sync_interval
+        self._last_sync = time.time()
+        self._modified = False
+        self._init_index()
+
+    def _init_index(self):
+        # imdbid -> (title, year)
+        self._movies = {}
+        # clean title -> set of imdbids
+        self._titles = defaultdict(set)
+        # trigram -> set of clean titles
+        self._trigrams = defaultdict(set)
+        # cache keys whose responses are already in the index
+        self._cache_keys = set()
+
+    def open(self, path='.', index_name='title_index.db'):
+        """ Open a existing index or create a new one.
+
+        :param path: Path where the index should be saved.
+        :param index_name: Name of the index file to read/write from.
+
+        """
+        self._path = os.path.join(path, index_name)
+        os.makedirs(path, exist_ok=True)
+        stored = {}
+        try:
+            with open(self._path, 'rb') as f:
+                stored = pickle.load(f)
+        except FileNotFoundError:
+            pass
+        except (pickle.UnpicklingError, EOFError) as e:
+            print('Error while reading title index.', e)
+
+        # only movies and cache keys are persisted, lookups are rebuilt
+        self._init_index()
+        self._cache_keys = set(stored.get('cache_keys', ()))
+        for imdbid, (titles, year) in stored.get('movies', {}).items():
+            self._add_titles(imdbid, titles, year)
+
+    def add(self, result_dict):
+        """ Add the titles of a movie result_dict to the index.
+
+        Result dicts without imdbid or title are ignored.
+
+        :param result_dict: A movie result_dict, e.g. from a Result object.
+
+        """
+        imdbid, title = result_dict.get('imdbid'), result_dict.get('title')
+        if not (imdbid and title):
+            return
+
+        titles = [title, result_dict.get('original_title')]
+        for alternative_title in result_dict.get('alternative_titles') or []:
+            if isinstance(alternative_title, (tuple, list)):
+                alternative_title = alternative_title[-1]
+            titles.append(alternative_title)
+
+        titles = tuple(t for t in titles if isinstance(t, str) and t.strip())
+        with self._lock:
+            known_titles, _ = self._movies.get(imdbid, ((), None))
+            new_titles = set(titles) - set(known_titles)
+            if new_titles or imdbid not in self._movies:
+                self._add_titles(
+                    imdbid,
+                    known_titles + tuple(t for t in titles if t in new_titles),
+                    result_dict.get('year')
+                )
+                self._modified = True
+
+    def update_from_cache(self, cache, parse_response):
+        """ Add the movies of all cached responses not indexed yet.
+
+        :param cache: A open :class:`hugin.harvest.cache.Cache`.
+        :param parse_response: A function returning a movie result_dict or
+                               None for a cached url and response.
+
+        """
+        new_keys = set(cache.cache_keys() or ()) - self._cache_keys
+        for key in new_keys:
+            result_dict = parse_response(key, cache.read(key))
+            if result_dict:
+                self.add(result_dict)
+
+        if new_keys:
+            with self._lock:
+                self._cache_keys.update(new_keys)
+                self._modified = True
+
+    def _add_titles(self, imdbid, titles, year):
+        self._movies[imdbid] = (titles, year)
+        for title in titles:
+            clean_title = clean_movie_title(title)
+            if clean_title:
+                self._titles[clean_title].add(imdbid)
+                for trigram in self._split_trigrams(clean_title):
+                    self._trigrams[trigram].add(clean_title)
+
+    def lookup(self, title, year=None):
+        """ Return the imdbid best matching title and year.
+
+        :param title: A possibly misspelled movie title.
+        :param year: Release year of the movie, if known.
+        :returns: A imdbid or None if no title is similar enough.
+
+        """
+        clean_title = clean_movie_title(title)
+        if not clean_title:
+            return None
+
+        try:
+            year = int(year) if year else None
+        except ValueError:
+            year = None
+
+        with self._lock:
+            candidate_hits = Counter()
+            for trigram in self._split_trigrams(clean_title):
+                candidate_hits.update(self._trigrams.get(trigram, ()))
+            candidates = [
+                candidate for candidate, _ in
+                candidate_hits.most_common(self._max_candidates)
+            ]
+            ratios = clean_similarity_ratios(clean_title, candidates)
+
+            best_imdbid, best_ratio = None, self._min_ratio
+            for candidate, ratio in zip(candidates, ratios):
+                for imdbid in sorted(self._titles[candidate]):
+                    _, movie_year = self._movies[imdbid]
+                    if year and movie_year:
+                        ratio_year = ratio * year_penalty(year, movie_year)
+                    else:
+                        ratio_year = ratio
+                    if ratio_year > best_ratio:
+                        best_imdbid, best_ratio = imdbid, ratio_year
+        return best_imdbid
+
+    def title(self, imdbid):
+        """ Return a (title, year) tuple for imdbid or None if unknown. """
+        with self._lock:
+            titles, year = self._movies.get(imdbid, ((), None))
+        if titles:
+            return titles[0], year
+
+    def sync(self, force=False):
+        """ Write the index to disk if it was modified.
+
+        To keep batch runs cheap, the index is written at most once per
+        sync_interval seconds unless force is set.
+
+        """
+        if self._path is None:
+            print('Sync error, no open title index.')
+            return
+
+        with self._lock:
+            next_sync = self._last_sync + self._sync_interval
+            if self._modified and (force or time.time() >= next_sync):
+                self._write(self._path, {
+                    'movies': self._movies, 'cache_keys': self._cache_keys
+                })
+                self._modified = False
+                self._last_sync = time.time()
+
+    def close(self):
+        """ Write all pending changes to disk and close the index. """
+        self.sync(force=True)
+        self._path = None
+
+    def _write(self, path, stored):
+        """ Write the index atomically, a crash leaves the old one intact. """
+        try:
+            atomic_write(path, lambda f: pickle.dump(stored, f))
+        except OSError as e:
+            print('Error while writing title index.', e)
+
+    def _split_trigrams(self, clean_title):
+        padded = ' {} '.format(clean_title)
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    def __len__(self):
+        return len(self._movies)
+
+
+if __name__ == '__main__':
+    import unittest
+    import shutil
+    import tempfile
+    from hugin.harvest.cache import Cache
+
+    class TestTitleIndex(unittest.TestCase):
+
+        def setUp(self):
+            self._path = tempfile.mkdtemp()
+            self._index = TitleIndex()
+            self._index.open(self._path)
+            self._index.add({
+                'imdbid': 'tt0401792', 'title': 'Sin City', 'year': 2005,
+                'original_title': 'Sin City', 'alternative_titles': [
+                    ('DE', 'Sin City - Die Stadt der Sünde')
+                ]
+            })
+            self._index.add({
+                'imdbid': 'tt0458481', 'title': 'Sin City 2', 'year': 2014
+            })
+            self._index.add({
+                'imdbid': 'tt1602613', 'title': 'Only God Forgives',
+                'year': 2013
+            })
+            self._index.add({'imdbid': None, 'title': 'Nothing'})
+
+        def test_lookup(self):
+            self.assertEqual(self._index.lookup('Sun Sity'), 'tt0401792')
+            self.assertEqual(
+                self._index.lookup('sin city 2', 2014), 'tt0458481'
+            )
+            self.assertEqual(
+                self._index.lookup('unly gud forgivs'), 'tt1602613'
+            )
+            self.assertTrue(self._index.lookup('Katzenbaum') is None)
+            self.assertTrue(self._index.lookup('Nothing') is None)
+
+        def test_title(self):
+            self.assertEqual(
+                self._index.title('tt0401792'), ('Sin City', 2005)
+            )
+            self.assertTrue(self._index.title('tt0000000') is None)
+
+        def test_close_open(self):
+            self._index.close()
+            index = TitleIndex()
+            index.open(self._path)
+            self.assertEqual(len(index), 3)
+            self.assertEqual(index.lookup('Sun Sity'), 'tt0401792')
+            index.close()
+
+        def test_update_from_cache(self):
+            cache = Cache()
+            cache.open(self._path)
+            cache.write('http://a/tt0780504', 'Drive|2011')
+            cache.write('http://a/search', 'no movie')
+            parsed = []
+
+            def parse_response(url, response):
+                parsed.append(url)
+                if '|' in response:
+                    title, year = response.split('|')
+                    return {
+                        'imdbid': url.rsplit('/')[-1], 'title': title,
+                        'year': int(year)
+                    }
+
+            self._index.update_from_cache(cache, parse_response)
+            self.assertEqual(self._index.lookup('Drvie'), 'tt0780504')
+            self._index.close()
+
+            # already indexed responses are not parsed again
+            index = TitleIndex()
+            index.open(self._path)
+            index.update_from_cache(cache, parse_response)
+            self.assertEqual(len(parsed), 2)
+            self.assertEqual(index.title('tt0780504'), ('Drive', 2011))
+            index.close()
+            cache.close()
+
+        def tearDown(self):
+            shutil.rmtree(self._path)
+
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# encoding: utf-8
+
+""" File utils. """
+
+# stdlib
+import tempfile
+import stat
+import os
+
+
+def atomic_write(path, content, mode=None):
+    """
+    Replace the file at path, readers never see a partially written file.
+
+    The content is written to a temporary file in the same directory, which
+    then replaces path. On error the temporary file is removed and the error
+    is reraised, a existing file at path stays intact.
+
+    :param path: Path of the file to be written.
+    :param content: The bytes to write or a function that is called with the
+                    temporary file opened for binary writing.
+    :param mode: Permission bits of the file, defaults to the bits of the
+                 replaced file or 0o644 for a new file.
+
+    """
+    dirname, filename = os.path.split(os.path.abspath(path))
+    if mode is None:
+        try:
+            mode = stat.S_IMODE(os.stat(path).st_mode)
+        except FileNotFoundError:
+            mode = 0o644
+
+    fd, tmp_path = tempfile.mkstemp(
+        dir=dirname, prefix='.' + filename, suffix='.tmp'
+    )
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            if callable(content):
+                content(f)
+            else:
+                f.write(content)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+if __name__ == '__main__':
+    import unittest
+    import shutil
+
+    class TestFileUtil(unittest.TestCase):
+
+        def setUp(self):
+            self._path = tempfile.mkdtemp()
+            self._file = os.path.join(self._path, 'katzen.nfo')
+
+        def test_write_replace(self):
+            atomic_write(self._file, b'katze')
+            self.assertEqual(stat.S_IMODE(os.stat(self._file).st_mode), 0o644)
+            os.chmod(self._file, 0o600)
+            atomic_write(self._file, lambda f: f.write(b'baum'))
+            with open(self._file, 'rb') as f:
+                self.assertEqual(f.read(), b'baum')
+            self.assertEqual(stat.S_IMODE(os.stat(self._file).st_mode), 0o600)
+            self.assertEqual(os.listdir(self._path), ['katzen.nfo'])
+
+        def test_failed_write(self):
+            atomic_write(self._file, b'katze')
+
+            def write_fails(f):
+                f.write(b'baum')
+                raise OSError('disk full')
+
+            self.assertRaises(OSError, atomic_write, self._file, write_fails)
+            with open(self._file, 'rb') as f:
+                self.assertEqual(f.read(), b'katze')
+            self.assertEqual(os.listdir(self._path), ['katzen.nfo'])
+
+        def tearDown(self):
+            shutil.rmtree(self._path)
+
+    unittest.main()
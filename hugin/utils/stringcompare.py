@@ -3,29 +3,133 @@
 
 """ String compare utils. """
 
+# stdlib
+from collections import Counter
+from functools import lru_cache
 import difflib
+
+# 3rd party
 from pyxdameraulevenshtein import normalized_damerau_levenshtein_distance
 
+# the batch api is only available in newer pyxdameraulevenshtein versions
+try:
+    from pyxdameraulevenshtein import \
+        normalized_damerau_levenshtein_distance_seqs
+except ImportError:
+    normalized_damerau_levenshtein_distance_seqs = None
+
+
+# Upper limits for the memoized normalized titles and similarity ratios
+TITLE_CACHE_SIZE = 4096
+RATIO_CACHE_SIZE = 16384
 
-def string_similarity_ratio(s1, s2):
+
+def string_similarity_ratio(s1, s2, min_ratio=None):
     """
-    A string compare function, using the Redcliff-Obershelp algorithm. For
-    further details see: http://docs.python.org/3.3/library/difflib.html
-    TODO: Levenshtein might be better for this purpose.
+    A string compare function, using the Damerau-Levenshtein distance.
+
+    Normalized titles and ratios are memoized, so comparing the same strings
+    again is cheap.
+
+    If min_ratio is given, a cheap upper bound of the ratio is calculated
+    first. If the bound is not greater than min_ratio, the full distance
+    calculation is skipped and the bound is returned instead. This is useful
+    when only the best of multiple ratios is of interest, e.g.
+    ``ratio = max(ratio, string_similarity_ratio(a, b, min_ratio=ratio))``.
 
     :params s1, s2: Two input strings which will be compared
+    :param min_ratio: Ratio the result has to beat to be calculated exactly.
     :returns: A ratio between 0.0 (not similar at all) and 1.0 (probably the
     same string).
 
     """
     if s1 and s2:
-        return 1 - normalized_damerau_levenshtein_distance(
-            _clean_movie_title(s1),
-            _clean_movie_title(s2)
+        clean_s1, clean_s2 = clean_movie_title(s1), clean_movie_title(s2)
+        if min_ratio is not None:
+            upper_bound = similarity_upper_bound(clean_s1, clean_s2)
+            if upper_bound <= min_ratio:
+                return upper_bound
+
+        # the distance is symmetric, sorting doubles the cache hit rate
+        if clean_s1 > clean_s2:
+            clean_s1, clean_s2 = clean_s2, clean_s1
+        return _clean_similarity_ratio(clean_s1, clean_s2)
+
+
+def similarity_upper_bound(clean_s1, clean_s2):
+    """
+    Return an upper bound for the similarity ratio of two cleaned titles.
+
+    The bound is based on the length difference and the character
+    multiset difference (bag distance) of both strings, which are both lower
+    bounds of the Damerau-Levenshtein distance.
+
+    :params clean_s1, clean_s2: Titles normalized by :func:`clean_movie_title`
+    :returns: A value the real ratio will never exceed.
+
+    """
+    max_len = max(len(clean_s1), len(clean_s2))
+    if max_len == 0:
+        return 1.0
+
+    length_bound = 1 - abs(len(clean_s1) - len(clean_s2)) / max_len
+    if length_bound == 0.0:
+        return length_bound
+
+    chars_s1, chars_s2 = _char_counts(clean_s1), _char_counts(clean_s2)
+    bag_distance = max(
+        sum((chars_s1 - chars_s2).values()),
+        sum((chars_s2 - chars_s1).values())
+    )
+    return min(length_bound, 1 - bag_distance / max_len)
+
+
+@lru_cache(maxsize=RATIO_CACHE_SIZE)
+def _clean_similarity_ratio(clean_s1, clean_s2):
+    """ Memoized similarity ratio of two already cleaned titles. """
+    return 1 - normalized_damerau_levenshtein_distance(clean_s1, clean_s2)
+
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def _char_counts(clean_title):
+    """ Memoized character multiset of a cleaned title. """
+    return Counter(clean_title)
+
+
+def clean_similarity_ratios(clean_title, clean_titles):
+    """
+    Batch variant of :func:`string_similarity_ratio` for cleaned titles.
+
+    All titles have to be normalized by :func:`clean_movie_title` already.
+    The distances are computed in a single call to the C extension if the
+    installed pyxdameraulevenshtein version supports it.
+
+    :param clean_title: The cleaned title every other title is compared to.
+    :param clean_titles: A sequence with cleaned titles.
+    :returns: A list with ratios in the same order as clean_titles.
+
+    """
+    if normalized_damerau_levenshtein_distance_seqs is not None:
+        distances = normalized_damerau_levenshtein_distance_seqs(
+            clean_title, list(clean_titles)
         )
+    else:
+        distances = [
+            normalized_damerau_levenshtein_distance(clean_title, title)
+            for title in clean_titles
+        ]
+    return [1 - distance for distance in distances]
+
+
+@lru_cache(maxsize=TITLE_CACHE_SIZE)
+def clean_movie_title(title):
+    """
+    Normalize a movie title for comparison.
 
+    The title is uppercased, commas are removed and the words are sorted.
+    Results are memoized.
 
-def _clean_movie_title(title):
+    """
     if title:
         title = title.upper()
         word_list = title.replace(',', ' ').split()
@@ -54,4 +158,35 @@ if __name__ == '__main__':
             ratio = string_similarity_ratio('katzenbaum', 'katzenwald')
             self.assertTrue(ratio >= 0.7)
 
+        def test_min_ratio(self):
+            pairs = [
+                ('katzenbaum', 'katzenwald'), ('katzenbaum', 'elchwald'),
+                ('Sin City', 'City, Sin'), ('Sin City', 'Sin City 2'),
+                ('Drive', 'Only God Forgives'), ('a', 'b')
+            ]
+            for s1, s2 in pairs:
+                exact = string_similarity_ratio(s1, s2)
+                self.assertEqual(exact, string_similarity_ratio(s2, s1))
+                for min_ratio in [0.0, 0.3, 0.5, 0.8, 1.0]:
+                    ratio = string_similarity_ratio(s1, s2, min_ratio)
+                    self.assertEqual(
+                        max(min_ratio, ratio), max(min_ratio, exact)
+                    )
+
+        def test_upper_bound(self):
+            for s1, s2 in [('ABC', 'CBA'), ('ABCD', 'X'), ('', ''), ('A', '')]:
+                exact = 1 - normalized_damerau_levenshtein_distance(s1, s2)
+                self.assertTrue(similarity_upper_bound(s1, s2) >= exact)
+
+        def test_clean_similarity_ratios(self):
+            titles = ['katzenbaum', 'katzenwald', 'elchwald', 'baum, katzen']
+            ratios = clean_similarity_ratios(
+                clean_movie_title('katzenbaum'),
+                [clean_movie_title(title) for title in titles]
+            )
+            self.assertEqual(ratios, [
+                string_similarity_ratio('katzenbaum', title)
+                for title in titles
+            ])
+
     unittest.main()
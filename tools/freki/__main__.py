@@ -4,13 +4,13 @@
 """Libhugin analyzer commandline testtool.
 
 Usage:
-  freki create <database> <datapath>
+  freki create <database> <datapath>...
   freki list <database>
   freki list <database> attr <attr>
   freki list <database> analyzerdata
   freki list-modifier | list-analyzer
-  freki (analyze | modify) plugin <plugin> <database>
-  freki (analyze | modify) plugin <plugin> pluginattrs <pluginattrs> <database>
+  freki (analyze | modify) plugin <plugin> <database> [--force]
+  freki (analyze | modify) plugin <plugin> pluginattrs <pluginattrs> <database> [--force]
   freki export <database>
   freki -h | --help
   freki --version
@@ -18,6 +18,7 @@ Usage:
 Options:
   -v, --version                     Show version.
   -h, --help                        Show this screen.
+  --force                           Also process unchanged movies.
 
 """
 
@@ -27,8 +28,6 @@ import pprint
 # 3rd party
 from docopt import docopt
 from hugin.analyze.session import Session
-from hugin.filewalk import data_import
-from hugin.filewalk import data_export
 from hugin.filewalk import attr_import_func
 from hugin.filewalk import attr_mapping
 
@@ -42,6 +41,11 @@ def list_plugins(plugins):
         )
 
 
+def print_progress(done, total):
+    if done == total or not done % 100:
+        print('\rExported {}/{}'.format(done, total), end='', flush=True)
+
+
 def split_pluginattrs(pluginattrs):
     try:
         raw_attrs = pluginattrs.split(',')
@@ -64,16 +68,19 @@ if __name__ == '__main__':
 
     if args['create']:
         s = Session(args['<database>'], attr_mask=MASK)
-        path = args['<datapath>']
-        metadata = data_import(path)
-        for nfofile in metadata:
-            s.add(nfofile, attr_import_func)
+        report = s.rescan(args['<datapath>'], attr_import_func)
+        for change, keys in sorted(report.items()):
+            print('{}: {}'.format(change.capitalize(), len(keys)))
         s.database_close()
 
     if args['export']:
         s = Session(args['<database>'], attr_mask=MASK)
-        database = s.get_database()
-        data_export(database.values())
+        counts = s.export(MASK, progress=print_progress)
+        print('\n' + ', '.join(
+            '{}: {}'.format(key.capitalize(), value)
+            for key, value in sorted(counts.items())
+        ))
+        s.database_close()
 
     if args['list']:
         s = Session(args['<database>'], attr_mask=MASK)
@@ -97,14 +104,16 @@ if __name__ == '__main__':
 
     if any([args['analyze'], args['modify']]):
         s = Session(args['<database>'], attr_mask=MASK)
-        database = s.get_database()
-        for movie in database.values():
-            if args['analyze']:
-                plugin = s.analyzer_plugins(args['<plugin>'])
-                plugin.analyze(movie, **cluster_kwargs(args, plugin))
-            elif args['modify']:
-                plugin = s.modifier_plugins(args['<plugin>'])
-                plugin.modify(movie, **cluster_kwargs(args, plugin))
+        if args['analyze']:
+            plugin = s.analyzer_plugins(args['<plugin>'])
+            s.analyze_all(
+                plugin, force=args['--force'], **cluster_kwargs(args, plugin)
+            )
+        elif args['modify']:
+            plugin = s.modifier_plugins(args['<plugin>'])
+            s.modify_all(
+                plugin, force=args['--force'], **cluster_kwargs(args, plugin)
+            )
         s.database_close()
 
     if any([args['list-modifier'], args['list-analyzer']]):
@@ -12,12 +12,14 @@ from flask import request
 # hugin
 import hugin.harvest.session as HarvestSession
 import hugin.analyze.session as AnalyzerSession
+from hugin.analyze.textclean import get_cleaner
 
 
 SESSION = HarvestSession.Session()
 ANALYZER = AnalyzerSession.Session('/tmp/dummydbforanalyzer')
 
 POSTPROCESSING = False
+CLEANER = get_cleaner(['brackets'])
 CACHE = {}
 
 app = Flask(__name__)
@@ -113,11 +115,8 @@ def _build_search_results(results):
 
 
 def postprocess(result):
-    """ Postprocess example. """
-    bracketclean = ANALYZER.modifier_plugins('bracketclean')
-    result._result_dict['plot'] = ANALYZER.modify_raw(
-        bracketclean, 'plot', result._result_dict['plot']
-    )
+    """ Postprocess example, remove brackets from the plot. """
+    CLEANER.clean_attributes(result._result_dict, ['plot'])
 
 
 def _read_template(template):